@@ -1,15 +1,103 @@
-from models import app, Movie, Actor, db
-from flask import jsonify, request, abort
-from auth import requires_auth
-from datetime import datetime
+from models import app, Movie, Actor, db, to_date, to_age, normalize_gender, GENDERS, MIN_AGE, MAX_AGE, QUERY_CANCELED
+from flask import jsonify, request, abort, Response, stream_with_context
+from werkzeug.exceptions import HTTPException
+from sqlalchemy.exc import OperationalError
+from auth import requires_auth, readable_entities
+from changes import record_change, compacted_through, latest_seq, wait_for_changes, stream_changes, \
+    CHANGES_MAX_LIMIT, CHANGES_MAX_WAIT
+from stats import update_stats, get_stats
+from compression import compress_level
+from singleflight import coalesce
+from snapshot import catalogue_snapshot, SNAPSHOT_ENABLED
+from groupcommit import run_write
+from warmup import app_warmup, WARMUP_ON_START
+from profiling import load_profile
+from breaker import breaker_status
+from counts import total_count, COUNT_MODES
+import importer  # registers 'flask import-catalogue'
+import os
+
+# Pagination Config
+DEFAULT_PER_PAGE = int(os.getenv('DEFAULT_PER_PAGE', '50'))
+MAX_PER_PAGE = int(os.getenv('MAX_PER_PAGE', '1000'))
 
 # Convert date string to date object
 def parse_date(date_str):
     try:
-        return datetime.strptime(date_str, '%Y-%m-%d').date()
+        return to_date(date_str)
     except ValueError:
         abort(400, description='Invalid date format. Use YYYY-MM-DD.')
 
+# Validate an actor's age (whole number in range)
+def parse_age(age):
+    try:
+        return to_age(age)
+    except ValueError:
+        abort(400, description=f'Invalid age. Use a whole number between {MIN_AGE} and {MAX_AGE}.')
+
+# Validate an actor's gender (case-insensitive)
+def parse_gender(gender):
+    normalized = normalize_gender(gender)
+    if normalized is None:
+        abort(400, description=f'Invalid gender. Use one of: {", ".join(GENDERS)}.')
+    return normalized
+
+# Offset and limit from ?page=&per_page= (every row when neither is given)
+def page_window():
+    page = request.args.get('page', type=int)
+    per_page = request.args.get('per_page', type=int)
+    if page is None and per_page is None:
+        return 0, None
+    page = max(page or 1, 1)
+    per_page = max(1, min(per_page or DEFAULT_PER_PAGE, MAX_PER_PAGE))
+    return (page - 1) * per_page, per_page
+
+# Total count mode from ?count= (no total unless asked for)
+def count_mode():
+    mode = request.args.get('count', 'none')
+    if mode not in COUNT_MODES:
+        abort(400, description=f'Invalid count. Use one of: {", ".join(COUNT_MODES)}.')
+    return mode
+
+# Movie filters from the query string
+def movie_filters():
+    return {
+        'title': request.args.get('title') or None,
+        'released_after': parse_date(request.args['released_after']) if request.args.get('released_after') else None,
+        'released_before': parse_date(request.args['released_before']) if request.args.get('released_before') else None
+    }
+
+def filter_movies(filters):
+    query = Movie.query
+    if filters['title']:
+        query = query.filter(db.func.lower(Movie.title).contains(filters['title'].lower(), autoescape=True))
+    if filters['released_after']:
+        query = query.filter(Movie.release_date >= filters['released_after'])
+    if filters['released_before']:
+        query = query.filter(Movie.release_date <= filters['released_before'])
+    return query.order_by(Movie.id)
+
+# Actor filters from the query string
+def actor_filters():
+    return {
+        'name': request.args.get('name') or None,
+        'gender': parse_gender(request.args['gender']) if request.args.get('gender') else None,
+        'min_age': request.args.get('min_age', type=int),
+        'max_age': request.args.get('max_age', type=int)
+    }
+
+def filter_actors(filters):
+    query = Actor.query
+    if filters['name']:
+        query = query.filter(db.func.lower(Actor.name).contains(filters['name'].lower(), autoescape=True))
+    if filters['gender']:
+        query = query.filter(Actor.gender == filters['gender'])
+    if filters['min_age'] is not None:
+        query = query.filter(Actor.age >= filters['min_age'])
+    if filters['max_age'] is not None:
+        query = query.filter(Actor.age <= filters['max_age'])
+    return query.order_by(Actor.id)
+
 # Home route
 @app.route('/', methods=['GET'])
 def home():
@@ -43,27 +131,44 @@ def logout():
 # Get all movies
 @app.route('/movies', methods=['GET'])
 @requires_auth('get:movies')
+@coalesce
 def get_movies(jwt_payload):
 
-    # Fetch all movies from the database
-    movies = Movie.query.all()
+    # Read the filters, the page and the count mode
+    filters = movie_filters()
+    offset, limit = page_window()
+    mode = count_mode()
+    total = None
+
+    # Serve from the in-process snapshot when enabled (its counts are exact), otherwise from the database
+    if SNAPSHOT_ENABLED:
+        catalogue_snapshot.refresh()
+        movies = catalogue_snapshot.query_movies(filters, offset, limit)
+        if mode != 'none':
+            total = catalogue_snapshot.count_movies(filters)
+    else:
+        query = filter_movies(filters)
+        movies = [movie.format() for movie in query.offset(offset).limit(limit).all()]
+        if mode != 'none':
+            total = total_count(mode, 'movies', filters, query)
 
     # Send the response
-    return jsonify({
+    response = {
         'success': True,
-        'movies': [
-            {
-                'id': movie.id,
-                'title': movie.title,
-                'release_date': movie.release_date.strftime('%Y-%m-%d')
-            }
-            for movie in movies
-        ]
-    }), 200
+        'movies': movies
+    }
+    if limit is not None:
+        response['page'] = offset // limit + 1
+        response['per_page'] = limit
+    if total is None:
+        return jsonify(response), 200
+    response['total'] = total
+    return jsonify(response), 200, {'X-Total-Count': str(total)}
 
 # Get a single movie by ID
 @app.route('/movies/<int:movie_id>', methods=['GET'])
 @requires_auth('get:movies')
+@coalesce
 def get_movie(jwt_payload, movie_id):
 
     # Fetch the movie by ID
@@ -97,23 +202,23 @@ def create_movie(jwt_payload):
     response = {}
 
     # Create a new movie instance and add it to the database
-    try:
+    def create():
         release_date = parse_date(data['release_date'])
         new_movie = Movie(title=data['title'], release_date=release_date)
         db.session.add(new_movie)
-        db.session.commit()
+        db.session.flush()
+        record_change('movies', 'create', new_movie.id, new_movie.format())
+        update_stats('movies', after=new_movie.format())
+        return new_movie.format()
+
+    try:
+        response['movie'] = run_write(create)
         response['success'] = True
         response['message'] = 'Movie created successfully!'
-        response['movie'] = {
-            'id': new_movie.id,
-            'title': new_movie.title,
-            'release_date': new_movie.release_date.strftime('%Y-%m-%d')
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.session.rollback()
         abort(500, description=f'Failed to create movie: {str(e)}')
-    finally:
-        db.session.close()
 
     # Send the response
     return jsonify(response), 201
@@ -135,26 +240,25 @@ def update_movie(jwt_payload, movie_id):
     # INIT the Response
     response = {}
 
-    # Fetch the movie by ID
-    movie = Movie.query.get_or_404(movie_id, description='Movie not found with the provided ID.')
-
     # Update the movie instance and add it to the database
-    try:
+    def update():
+        # Fetch the movie by ID
+        movie = Movie.query.get_or_404(movie_id, description='Movie not found with the provided ID.')
+        before = movie.format()
         movie.title = data['title']
         movie.release_date = parse_date(data['release_date'])
-        db.session.commit()
+        record_change('movies', 'update', movie.id, movie.format())
+        update_stats('movies', before, movie.format())
+        return movie.format()
+
+    try:
+        response['movie'] = run_write(update)
         response['success'] = True
         response['message'] = 'Movie updated successfully!'
-        response['movie'] = {
-            'id': movie.id,
-            'title': movie.title,
-            'release_date': movie.release_date.strftime('%Y-%m-%d')
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.session.rollback()
         abort(500, description=f'Failed to update movie: {str(e)}')
-    finally:
-        db.session.close()
 
     # Send the response
     return jsonify(response), 201
@@ -176,28 +280,27 @@ def patch_movie(jwt_payload, movie_id):
     # INIT the Response
     response = {}
 
-    # Fetch the movie by ID
-    movie = Movie.query.get_or_404(movie_id, description='Movie not found with the provided ID.')
-
     # Update the movie instance and add it to the database
-    try:
+    def patch():
+        # Fetch the movie by ID
+        movie = Movie.query.get_or_404(movie_id, description='Movie not found with the provided ID.')
+        before = movie.format()
         if 'title' in data:
             movie.title = data['title']
         if 'release_date' in data:
             movie.release_date = parse_date(data['release_date'])
-        db.session.commit()
+        record_change('movies', 'update', movie.id, movie.format())
+        update_stats('movies', before, movie.format())
+        return movie.format()
+
+    try:
+        response['movie'] = run_write(patch)
         response['success'] = True
         response['message'] = 'Movie updated successfully!'
-        response['movie'] = {
-            'id': movie.id,
-            'title': movie.title,
-            'release_date': movie.release_date.strftime('%Y-%m-%d')
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.session.rollback()
         abort(500, description=f'Failed to update movie: {str(e)}')
-    finally:
-        db.session.close()
 
     # Send the response
     return jsonify(response), 201
@@ -207,23 +310,25 @@ def patch_movie(jwt_payload, movie_id):
 @requires_auth('delete:movies')
 def delete_movie(jwt_payload, movie_id):
 
-    # Check if the movie exists
-    movie = Movie.query.get_or_404(movie_id, description='Movie not found with the provided ID.')
-
     # INIT the Response
     response = {}
 
     # Delete the movie from the database
-    try:
+    def delete():
+        # Check if the movie exists
+        movie = Movie.query.get_or_404(movie_id, description='Movie not found with the provided ID.')
+        record_change('movies', 'delete', movie.id)
+        update_stats('movies', before=movie.format())
         db.session.delete(movie)
-        db.session.commit()
+
+    try:
+        run_write(delete)
         response['success'] = True
         response['message'] = 'Movie deleted successfully!'
+    except HTTPException:
+        raise
     except Exception as e:
-        db.session.rollback()
         abort(500, description=f'Failed to delete movie: {str(e)}')
-    finally:
-        db.session.close()
 
     # Send the response
     return jsonify(response), 200
@@ -231,28 +336,44 @@ def delete_movie(jwt_payload, movie_id):
 # Get all actors
 @app.route('/actors', methods=['GET'])
 @requires_auth('get:actors')
+@coalesce
 def get_actors(jwt_payload):
 
-    # Fetch all actors from the database
-    actors = Actor.query.all()
+    # Read the filters, the page and the count mode
+    filters = actor_filters()
+    offset, limit = page_window()
+    mode = count_mode()
+    total = None
+
+    # Serve from the in-process snapshot when enabled (its counts are exact), otherwise from the database
+    if SNAPSHOT_ENABLED:
+        catalogue_snapshot.refresh()
+        actors = catalogue_snapshot.query_actors(filters, offset, limit)
+        if mode != 'none':
+            total = catalogue_snapshot.count_actors(filters)
+    else:
+        query = filter_actors(filters)
+        actors = [actor.format() for actor in query.offset(offset).limit(limit).all()]
+        if mode != 'none':
+            total = total_count(mode, 'actors', filters, query)
 
     # Send the response
-    return jsonify({
+    response = {
         'success': True,
-        'actors': [
-            {
-                'id': actor.id,
-                'name': actor.name,
-                'age': actor.age,
-                'gender': actor.gender
-            }
-            for actor in actors
-        ]
-    }), 200
+        'actors': actors
+    }
+    if limit is not None:
+        response['page'] = offset // limit + 1
+        response['per_page'] = limit
+    if total is None:
+        return jsonify(response), 200
+    response['total'] = total
+    return jsonify(response), 200, {'X-Total-Count': str(total)}
 
 # Get a single actor by ID
 @app.route('/actors/<int:actor_id>', methods=['GET'])
 @requires_auth('get:actors')
+@coalesce
 def get_actor(jwt_payload, actor_id):
 
     # Fetch the actor by ID
@@ -287,23 +408,22 @@ def create_actor(jwt_payload):
     response = {}
 
     # Create a new actor instance and add it to the database
-    try:
-        new_actor = Actor(name=data['name'], age=data['age'], gender=data['gender'])
+    def create():
+        new_actor = Actor(name=data['name'], age=parse_age(data['age']), gender=parse_gender(data['gender']))
         db.session.add(new_actor)
-        db.session.commit()
+        db.session.flush()
+        record_change('actors', 'create', new_actor.id, new_actor.format())
+        update_stats('actors', after=new_actor.format())
+        return new_actor.format()
+
+    try:
+        response['actor'] = run_write(create)
         response['success'] = True
         response['message'] = 'Actor created successfully!'
-        response['actor'] = {
-            'id': new_actor.id,
-            'name': new_actor.name,
-            'age': new_actor.age,
-            'gender': new_actor.gender
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.session.rollback()
         abort(500, description=f'Failed to create actor: {str(e)}')
-    finally:
-        db.session.close()
 
     # Send the response
     return jsonify(response), 201
@@ -325,28 +445,26 @@ def update_actor(jwt_payload, actor_id):
     # INIT the Response
     response = {}
 
-    # Fetch the actor by ID
-    actor = Actor.query.get_or_404(actor_id, description='Actor not found with the provided ID.')
-
     # Update the actor instance and add it to the database
-    try:
+    def update():
+        # Fetch the actor by ID
+        actor = Actor.query.get_or_404(actor_id, description='Actor not found with the provided ID.')
+        before = actor.format()
         actor.name = data['name']
-        actor.age = data['age']
-        actor.gender = data['gender']
-        db.session.commit()
+        actor.age = parse_age(data['age'])
+        actor.gender = parse_gender(data['gender'])
+        record_change('actors', 'update', actor.id, actor.format())
+        update_stats('actors', before, actor.format())
+        return actor.format()
+
+    try:
+        response['actor'] = run_write(update)
         response['success'] = True
         response['message'] = 'Actor updated successfully!'
-        response['actor'] = {
-            'id': actor.id,
-            'name': actor.name,
-            'age': actor.age,
-            'gender': actor.gender
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.session.rollback()
         abort(500, description=f'Failed to update actor: {str(e)}')
-    finally:
-        db.session.close()
 
     # Send the response
     return jsonify(response), 201
@@ -368,31 +486,29 @@ def patch_actor(jwt_payload, actor_id):
     # INIT the Response
     response = {}
 
-    # Fetch the actor by ID
-    actor = Actor.query.get_or_404(actor_id, description='Actor not found with the provided ID.')
-
     # Update the actor instance and add it to the database
-    try:
+    def patch():
+        # Fetch the actor by ID
+        actor = Actor.query.get_or_404(actor_id, description='Actor not found with the provided ID.')
+        before = actor.format()
         if 'name' in data:
             actor.name = data['name']
         if 'age' in data:
-            actor.age = data['age']
+            actor.age = parse_age(data['age'])
         if 'gender' in data:
-            actor.gender = data['gender']
-        db.session.commit()
+            actor.gender = parse_gender(data['gender'])
+        record_change('actors', 'update', actor.id, actor.format())
+        update_stats('actors', before, actor.format())
+        return actor.format()
+
+    try:
+        response['actor'] = run_write(patch)
         response['success'] = True
         response['message'] = 'Actor updated successfully!'
-        response['actor'] = {
-            'id': actor.id,
-            'name': actor.name,
-            'age': actor.age,
-            'gender': actor.gender
-        }
+    except HTTPException:
+        raise
     except Exception as e:
-        db.session.rollback()
         abort(500, description=f'Failed to update actor: {str(e)}')
-    finally:
-        db.session.close()
 
     # Send the response
     return jsonify(response), 201
@@ -402,27 +518,149 @@ def patch_actor(jwt_payload, actor_id):
 @requires_auth('delete:actors')
 def delete_actor(jwt_payload, actor_id):
 
-    # Check if the actor exists
-    actor = Actor.query.get_or_404(actor_id, description='Actor not found with the provided ID.')
-
     # INIT the Response
     response = {}
 
     # Delete the actor from the database
-    try:
+    def delete():
+        # Check if the actor exists
+        actor = Actor.query.get_or_404(actor_id, description='Actor not found with the provided ID.')
+        record_change('actors', 'delete', actor.id)
+        update_stats('actors', before=actor.format())
         db.session.delete(actor)
-        db.session.commit()
+
+    try:
+        run_write(delete)
         response['success'] = True
         response['message'] = 'Actor deleted successfully!'
+    except HTTPException:
+        raise
     except Exception as e:
-        db.session.rollback()
         abort(500, description=f'Failed to delete actor: {str(e)}')
-    finally:
-        db.session.close()
 
     # Send the response
     return jsonify(response), 200
 
+# Change feed (deltas since a sequence number, as JSON long-poll or SSE)
+@app.route('/changes', methods=['GET'])
+@compress_level(gzip=1, br=1, zstd=1)
+@requires_auth(None)
+def get_changes(jwt_payload):
+
+    # Read the cursor; EventSource reconnects send it as Last-Event-ID, new consumers ask for 'latest'
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None and request.args.get('since') == 'latest':
+        since = latest_seq()
+    elif since is None:
+        since = request.args.get('since', 0, type=int)
+    limit = max(1, min(request.args.get('limit', 100, type=int), CHANGES_MAX_LIMIT))
+    wait = max(0.0, min(request.args.get('wait', 0, type=float), CHANGES_MAX_WAIT))
+
+    # Only expose changes for entities the caller can read
+    entities = readable_entities(jwt_payload)
+    if not entities:
+        abort(403, description='Reading changes needs get:movies or get:actors.')
+
+    # The cursor is older than the retained history; the client must resync from the current sequence number
+    through = compacted_through()
+    if since < through:
+        return jsonify({
+            'success': False,
+            'error_code': 410,
+            'message': 'Gone: Changes since the provided sequence number have been compacted. '
+                       'Reload the full list and follow on from last_seq.',
+            'last_seq': latest_seq(),
+            'compacted_through': through
+        }), 410
+
+    # Server-Sent Events
+    if request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream':
+        return Response(
+            stream_with_context(stream_changes(since, entities, limit)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    # Long-poll (or a plain poll when wait=0)
+    changes = wait_for_changes(since, entities, limit, wait)
+
+    # Send the response
+    return jsonify({
+        'success': True,
+        'changes': changes,
+        'last_seq': changes[-1]['seq'] if changes else since
+    }), 200
+
+# Catalogue statistics (movies per year, actors by gender and age bucket)
+@app.route('/stats', methods=['GET'])
+@requires_auth(None)
+def get_catalogue_stats(jwt_payload):
+
+    # Only expose stats for entities the caller can read
+    entities = readable_entities(jwt_payload)
+    if not entities:
+        abort(403, description='Reading statistics needs get:movies or get:actors.')
+
+    # Accept a cached answer up to max_age seconds old
+    max_age = max(0.0, request.args.get('max_age', 0, type=float))
+    result = get_stats(entities, max_age)
+
+    # Send the response
+    return jsonify(dict(result, success=True)), 200
+
+# Stored request profile (collapsed stacks, speedscope JSON or a cProfile report)
+@app.route('/profiles/<profile_id>', methods=['GET'])
+@requires_auth('profile:requests')
+def get_profile(jwt_payload, profile_id):
+
+    # Collapsed stacks unless another format is asked for
+    output_format = request.args.get('format', 'collapsed')
+    if output_format not in ('collapsed', 'speedscope', 'pstats'):
+        abort(400, description='Invalid format. Use collapsed, speedscope or pstats.')
+
+    profile = load_profile(profile_id, output_format)
+    if profile is None:
+        abort(404, description='Profile not found with the provided ID.')
+
+    # Send the response
+    body, mimetype = profile
+    return Response(body, mimetype=mimetype), 200
+
+# Readiness (load balancer health check; 503 until warm-up has finished). Unauthenticated,
+# so it reports states and counts only, no error messages
+@app.route('/ready', methods=['GET'])
+def ready():
+    is_ready = app_warmup.ready()
+
+    # Send the response
+    return jsonify({
+        'success': is_ready,
+        'ready': is_ready,
+        'warmup': app_warmup.report(),
+        'breakers': breaker_status()
+    }), 200 if is_ready else 503
+
+# Circuit breaker states (Auth0 JWKS, database) and warm-up errors for operators
+@app.route('/breakers', methods=['GET'])
+@requires_auth('profile:requests')
+def breakers(jwt_payload):
+
+    # Send the response
+    return jsonify({
+        'success': True,
+        'breakers': breaker_status(errors=True),
+        'warmup': app_warmup.report(errors=True)
+    }), 200
+
+# Statements behind the hot routes, compiled by the warm-up (filter values do not matter)
+HOT_QUERIES = [
+    lambda: filter_movies({'title': None, 'released_after': None, 'released_before': None}).offset(0).limit(DEFAULT_PER_PAGE).all(),
+    lambda: filter_actors({'name': None, 'gender': None, 'min_age': None, 'max_age': None}).offset(0).limit(DEFAULT_PER_PAGE).all(),
+    lambda: Movie.query.get(0),
+    lambda: Actor.query.get(0),
+    compacted_through,
+]
+
 # Error handlers
 @app.errorhandler(400)
 def bad_request(error):
@@ -464,6 +702,33 @@ def method_not_allowed(error):
         'message': f'Method Not Allowed: {error}'
     }), 405
 
+@app.errorhandler(410)
+def gone(error):
+    return jsonify({
+        'success': False,
+        'error_code': 410,
+        'message': f'Gone: {error}'
+    }), 410
+
+@app.errorhandler(503)
+def service_unavailable(error):
+    return jsonify({
+        'success': False,
+        'error_code': 503,
+        'message': f'Service Unavailable: {error}'
+    }), 503
+
+# Lost database connections and statement timeouts
+@app.errorhandler(OperationalError)
+def database_unavailable(error):
+    if not error.connection_invalidated and getattr(error.orig, 'pgcode', None) != QUERY_CANCELED:
+        return internal_error(error)
+    return jsonify({
+        'success': False,
+        'error_code': 503,
+        'message': 'Service Unavailable: the database did not respond in time.'
+    }), 503
+
 @app.errorhandler(500)
 def internal_error(error):
     return jsonify({
@@ -472,5 +737,9 @@ def internal_error(error):
         'message': f'Internal Server Error: {error}'
     }), 500
 
+# Warm the worker up in the background (the web process sets WARMUP_ON_START)
+if WARMUP_ON_START:
+    app_warmup.start(HOT_QUERIES)
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -1,14 +1,24 @@
 import json
-from flask import request, _request_ctx_stack, abort, jsonify
+from flask import request, _request_ctx_stack, abort, jsonify, g
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+from urllib.parse import urlsplit
+import http.client
 import os
+import threading
+import time
+from profiling import profile_mode, profile_call, profile_requested, PROFILE_PERMISSION
+from breaker import CircuitBreaker
 
 
 AUTH0_DOMAIN = os.getenv('AUTH0_DOMAIN')
 ALGORITHMS = os.getenv('ALGORITHMS')
 API_AUDIENCE = os.getenv('API_AUDIENCE')
+JWKS_CACHE_TTL = float(os.getenv('JWKS_CACHE_TTL', '3600'))
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv('JWKS_MIN_REFRESH_INTERVAL', '30'))
+JWKS_URL = os.getenv('JWKS_URL') or (f'https://{AUTH0_DOMAIN}/.well-known/jwks.json' if AUTH0_DOMAIN else None)
+JWKS_CONNECT_TIMEOUT = float(os.getenv('JWKS_CONNECT_TIMEOUT', '2'))
+JWKS_READ_TIMEOUT = float(os.getenv('JWKS_READ_TIMEOUT', '3'))
 
 ## AuthError Exception
 '''
@@ -51,33 +61,87 @@ def check_permissions(permission, payload):
     # Passed all checks
     return True
 
-# !!NOTE urlopen has a common certificate error described here: https://stackoverflow.com/questions/50236117/scraping-ssl-certificate-verify-failed-error-for-http-en-wikipedia-org
-def verify_decode_jwt(token):
+## Entities the token is allowed to read
+def readable_entities(payload):
+    permissions = payload.get('permissions', [])
+    return [entity for entity in ('movies', 'actors') if f'get:{entity}' in permissions]
+
+## JSON Web Key Set
+def fetch_jwks():
+    url = urlsplit(JWKS_URL)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+    connection = connection_class(url.hostname, url.port, timeout=JWKS_CONNECT_TIMEOUT)
+    try:
+        # The connect timeout covers the TCP and TLS handshake; each read then gets its own
+        connection.connect()
+        connection.sock.settimeout(JWKS_READ_TIMEOUT)
+        connection.request('GET', f'{url.path}?{url.query}' if url.query else url.path or '/')
+        response = connection.getresponse()
+        if response.status != 200:
+            raise OSError(f'JWKS request returned HTTP {response.status}')
+        return json.loads(response.read())
+    finally:
+        connection.close()
+
+jwks_breaker = CircuitBreaker('auth0-jwks')
+
+# Cached per worker, so tokens are not verified against a fresh download
+_jwks = {'keys': None, 'fetched_at': 0.0}
+_jwks_lock = threading.Lock()
+
+def jwks_stale(refresh):
+    age = time.monotonic() - _jwks['fetched_at']
+    # Forced refreshes are rate-limited so tokens with a bogus kid cannot hammer Auth0
+    return _jwks['keys'] is None or age > JWKS_CACHE_TTL or (refresh and age > JWKS_MIN_REFRESH_INTERVAL)
+
+def get_jwks(refresh=False):
+    if not jwks_stale(refresh):
+        return _jwks['keys']
+
+    # One thread fetches; while it does, the others keep using the keys we have
+    if not _jwks_lock.acquire(blocking=_jwks['keys'] is None):
+        return _jwks['keys']
+    try:
+        if jwks_stale(refresh):
+            try:
+                _jwks['keys'] = jwks_breaker.call(fetch_jwks)
+                _jwks['fetched_at'] = time.monotonic()
+            except Exception:
+                # Auth0 is slow or down (or the breaker is open): the last known keys still verify tokens
+                if _jwks['keys'] is None:
+                    abort(503, description='Unable to fetch the signing keys to verify the token.')
+        return _jwks['keys']
+    finally:
+        _jwks_lock.release()
+
+def find_rsa_key(jwks, kid):
+    for key in jwks['keys']:
+        if key['kid'] == kid:
+            return {
+                'kty': key['kty'],
+                'kid': key['kid'],
+                'use': key['use'],
+                'n': key['n'],
+                'e': key['e']
+            }
+    return {}
 
-    # Get Public Key from Auth0
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
+def verify_decode_jwt(token):
 
     # Get the data in the header
     unverified_header = jwt.get_unverified_header(token)
 
     # Choose the Key
-    rsa_key = {}
     if 'kid' not in unverified_header:
         raise AuthError({
             'code' : 'invalid_header',
             'description' : 'Authorisation malformed'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    # Get Public Key from Auth0 (cached); an unknown kid means the keys were rotated
+    rsa_key = find_rsa_key(get_jwks(), unverified_header['kid'])
+    if not rsa_key:
+        rsa_key = find_rsa_key(get_jwks(refresh=True), unverified_header['kid'])
 
     if rsa_key:
         try:
@@ -112,15 +176,20 @@ def verify_decode_jwt(token):
         'description': 'Unable to find the appropriate key.'
     }, 400)
 
-# Requires Permission Decorator
+# Requires Permission Decorator (permission=None: any valid token, the route checks what it may read)
 def requires_auth(permission=''):
     def requires_auth_decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
+        def authorized(*args, **kwargs):
             jwt_token = get_token_auth_header()
             try:
                 payload = verify_decode_jwt(jwt_token)
-                check_permissions(permission, payload)
+                if permission is not None:
+                    check_permissions(permission, payload)
+
+                # Asking for a profile needs its own permission
+                if profile_requested():
+                    check_permissions(PROFILE_PERMISSION, payload)
+                    g.profile_allowed = True
             except AuthError as e:
                 return jsonify({
                     'success': False,
@@ -128,5 +197,13 @@ def requires_auth(permission=''):
                     'message': e.error
                 }), 403
             return f(payload, *args, **kwargs)
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # Profile from before the token is decoded, so jwt.decode shows up too
+            mode = profile_mode()
+            if mode is None:
+                return authorized(*args, **kwargs)
+            return profile_call(mode, authorized, *args, **kwargs)
         return wrapper
     return requires_auth_decorator
\ No newline at end of file
@@ -0,0 +1,55 @@
+"""CPU vs bytes for compressing a GET /movies body at several levels.
+
+Usage: python benchmarks/compression_bench.py [rows]
+"""
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from compression import ENCODERS
+
+# Levels to try for each encoding
+LEVELS = {
+    'gzip': (1, 3, 6, 9),
+    'br': (1, 4, 6, 9, 11),
+    'zstd': (1, 3, 6, 12, 19),
+}
+
+# Build a body shaped like the get_movies response
+def movies_body(rows):
+    random.seed(0)
+    words = ['The', 'Last', 'Night', 'Return', 'Of', 'Star', 'City', 'Dark', 'Love', 'War', 'Lost', 'Blue']
+    movies = [
+        {
+            'id': i,
+            'title': ' '.join(random.choice(words) for _ in range(random.randint(1, 4))),
+            'release_date': (date(1950, 1, 1) + timedelta(days=random.randint(0, 27000))).strftime('%Y-%m-%d')
+        }
+        for i in range(1, rows + 1)
+    ]
+    return json.dumps({'success': True, 'movies': movies}).encode()
+
+def run(encoding, level, body, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        encoder = ENCODERS[encoding](level)
+        out = encoder.compress(body) + encoder.finish()
+    return (time.perf_counter() - started) / repeat, len(out)
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    body = movies_body(rows)
+    repeat = 5
+
+    print(f'{rows} movies, {len(body)} bytes uncompressed')
+    print(f'{"encoding":<8} {"level":>5} {"bytes":>10} {"ratio":>7} {"ms":>9} {"MB/s":>8}')
+    for encoding in ENCODERS:
+        for level in LEVELS[encoding]:
+            seconds, size = run(encoding, level, body, repeat)
+            print(f'{encoding:<8} {level:>5} {size:>10} {len(body) / size:>7.1f} '
+                  f'{seconds * 1000:>9.2f} {len(body) / seconds / 1e6:>8.1f}')
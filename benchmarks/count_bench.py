@@ -0,0 +1,61 @@
+"""Cost of ?count=none|exact|estimated on a paginated GET /actors as the table grows.
+
+Usage: python benchmarks/count_bench.py [rows ...]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import app, db, Actor
+from stats import recompute_stats
+import counts
+
+def seed(rows):
+    random.seed(0)
+    db.session.execute(Actor.__table__.insert(), [
+        {'name': f'Actor {i}', 'age': random.randint(5, 90), 'gender': random.choice(['Male', 'Female'])}
+        for i in range(rows)
+    ])
+    db.session.commit()
+    recompute_stats()
+
+def page(filters, mode):
+    query = Actor.query.order_by(Actor.id)
+    if filters.get('gender'):
+        query = query.filter(Actor.gender == filters['gender'])
+    actors = [actor.format() for actor in query.offset(100).limit(50)]
+    if mode != 'none':
+        counts.total_count(mode, 'actors', filters, query)
+    return actors
+
+def measure(label, fn, repeat=20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1000
+
+if __name__ == '__main__':
+    sizes = [int(size) for size in sys.argv[1:]] or [10000, 100000, 1000000]
+    print(f'{"rows":>9} {"filter":<12} {"none":>9} {"exact*":>9} {"exact":>9} {"estimated":>9}   (ms per page)')
+    for rows in sizes:
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        with app.app_context():
+            db.create_all()
+            seed(rows)
+            for label, filters in (('-', {'gender': None}), ('gender=Male', {'gender': 'Male'})):
+                results = [measure('none', lambda: page(filters, 'none'))]
+
+                # exact*: a fresh COUNT every time (cache emptied), exact: cached within COUNT_CACHE_TTL
+                def uncached():
+                    counts._cache.clear()
+                    page(filters, 'exact')
+                results.append(measure('exact*', uncached))
+                results.append(measure('exact', lambda: page(filters, 'exact')))
+                results.append(measure('estimated', lambda: page(filters, 'estimated')))
+                print(f'{rows:>9} {label:<12} ' + ' '.join(f'{result:>9.2f}' for result in results))
+            db.session.remove()
+            db.drop_all()
+            db.engine.dispose()
@@ -0,0 +1,79 @@
+"""Per-request commit vs group commit for concurrent movie creates.
+
+Usage: python benchmarks/group_commit_bench.py [threads] [writes_per_thread]
+
+Uses DATABASE_URL when set (point it at Postgres to measure real fsync
+costs), otherwise a temporary SQLite file.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import app, db, Movie, Change, CatalogueStat
+from changes import record_change
+from stats import update_stats
+from groupcommit import GroupCommitter, commit_one
+
+# Same work as the create_movie handler
+def create_movie(title):
+    def create():
+        movie = Movie(title=title, release_date=date(2023, 1, 1))
+        db.session.add(movie)
+        db.session.flush()
+        record_change('movies', 'create', movie.id, movie.format())
+        update_stats('movies', after=movie.format())
+        return movie.format()
+    return create
+
+def run(label, threads, writes, write):
+    def worker(index):
+        with app.app_context():
+            for i in range(writes):
+                write(create_movie(f'Movie {index}-{i}'))
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    total = threads * writes
+    print(f'{label:<22} {total:>7} writes {elapsed:>8.2f} s {total / elapsed:>10.0f} writes/s')
+
+def reset():
+    for model in (Movie, Change, CatalogueStat):
+        db.session.query(model).delete()
+    db.session.commit()
+
+if __name__ == '__main__':
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    path = None
+    if not os.getenv('DATABASE_URL'):
+        handle, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+
+    with app.app_context():
+        db.create_all()
+        print(f'{threads} threads x {writes} writes on {db.engine.dialect.name}')
+
+        reset()
+        run('per-request commit', threads, writes, commit_one)
+
+        for window, max_ops in ((0.002, 64), (0.005, 64)):
+            reset()
+            committer = GroupCommitter(window=window, max_ops=max_ops)
+            run(f'group {window * 1000:.0f} ms/{max_ops} ops', threads, writes, committer.submit)
+
+    if path:
+        os.remove(path)
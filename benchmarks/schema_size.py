@@ -0,0 +1,78 @@
+"""Table and index sizes before and after the compact schema migration.
+
+Usage: python benchmarks/schema_size.py [rows]
+
+Uses DATABASE_URL when set (an empty Postgres database), otherwise a
+temporary SQLite file. Loads rows at the previous revision, measures,
+upgrades to c75f8661080d and measures again.
+"""
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+from flask_migrate import upgrade
+from sqlalchemy import text
+from models import app, db
+
+BEFORE = 'f22060676e33'
+AFTER = 'c75f8661080d'
+
+def seed(rows):
+    random.seed(0)
+    db.session.execute(text('INSERT INTO movies (title, release_date) VALUES (:title, :release_date)'), [
+        {'title': f'Movie {i}', 'release_date': date(1950, 1, 1) + timedelta(days=random.randint(0, 27000))}
+        for i in range(rows)
+    ])
+    db.session.execute(text('INSERT INTO actors (name, age, gender) VALUES (:name, :age, :gender)'), [
+        {'name': f'Actor {i}', 'age': random.randint(5, 90), 'gender': random.choice(['Male', 'Female'])}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+def sizes():
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('VACUUM ANALYZE'))
+        return dict(db.session.execute(text("""
+            SELECT c.relname, pg_relation_size(c.oid)
+            FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relkind IN ('r', 'i')
+              AND (c.relname LIKE 'movies%' OR c.relname LIKE 'actors%'
+                   OR c.relname LIKE 'ix_movies%' OR c.relname LIKE 'ix_actors%')
+        """)).all())
+    db.session.execute(text('VACUUM'))
+    return dict(db.session.execute(text("""
+        SELECT dbstat.name, SUM(dbstat.pgsize) FROM dbstat
+        JOIN sqlite_master ON sqlite_master.name = dbstat.name
+        WHERE sqlite_master.tbl_name IN ('movies', 'actors') GROUP BY dbstat.name
+    """)).all())
+
+def report(label, measured):
+    print(label)
+    for name, size in sorted(measured.items()):
+        print(f'  {name:<32} {size / 1024:>10.0f} KiB')
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    path = None
+    if not os.getenv('DATABASE_URL'):
+        handle, path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+
+    with app.app_context():
+        directory = os.path.join(ROOT, 'migrations')
+        upgrade(directory=directory, revision=BEFORE)
+        seed(rows)
+        report(f'{rows} movies and {rows} actors on {db.engine.dialect.name}, before', sizes())
+        db.session.close()
+        upgrade(directory=directory, revision=AFTER)
+        report('after', sizes())
+
+    if path:
+        os.remove(path)
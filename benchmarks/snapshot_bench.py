@@ -0,0 +1,88 @@
+"""ORM vs columnar snapshot for serving GET /movies and GET /actors.
+
+Usage: python benchmarks/snapshot_bench.py [rows]
+"""
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from models import app, db, Movie, Actor
+from snapshot import CatalogueSnapshot
+
+def seed(rows):
+    random.seed(0)
+    db.session.execute(Movie.__table__.insert(), [
+        {'title': f'Movie {i}', 'release_date': date(1950, 1, 1) + timedelta(days=random.randint(0, 27000))}
+        for i in range(rows)
+    ])
+    db.session.execute(Actor.__table__.insert(), [
+        {'name': f'Actor {i}', 'age': random.randint(5, 90), 'gender': random.choice(['Male', 'Female'])}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+def measure(label, rows, fn, repeat=3):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f'{label:<36} {elapsed * 1000:>9.1f} ms {rows / elapsed:>12.0f} rows/s')
+
+def retained(fn):
+    # Bytes still allocated while what fn() returns is alive
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fn()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return size
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+
+    with app.app_context():
+        db.create_all()
+        seed(rows)
+        snapshot = CatalogueSnapshot()
+        snapshot.refresh(force=True)
+
+        print(f'{rows} movies and {rows} actors')
+        measure('ORM     GET /movies', rows, lambda: [m.format() for m in Movie.query.order_by(Movie.id).all()])
+        db.session.expunge_all()
+        measure('snapshot GET /movies', rows, lambda: snapshot.query_movies({}))
+        measure('ORM     GET /actors', rows, lambda: [a.format() for a in Actor.query.order_by(Actor.id).all()])
+        db.session.expunge_all()
+        measure('snapshot GET /actors', rows, lambda: snapshot.query_actors({}))
+        measure('ORM     GET /actors?gender=Male&page=3', 50, lambda: [
+            a.format() for a in Actor.query.filter(Actor.gender == 'Male').order_by(Actor.id).offset(100).limit(50)
+        ])
+        measure('snapshot GET /actors?gender=Male&page=3', 50,
+                lambda: snapshot.query_actors({'gender': 'Male'}, 100, 50))
+
+        def load_orm():
+            movies, actors = Movie.query.all(), Actor.query.all()
+            return movies, actors
+
+        def load_snapshot():
+            fresh = CatalogueSnapshot()
+            fresh.load()
+            return fresh
+
+        # Drop the timing snapshot so its interned strings are not shared
+        del snapshot
+        db.session.expunge_all()
+        orm_bytes = retained(load_orm)
+        db.session.expunge_all()
+        snapshot_bytes = retained(load_snapshot)
+        print(f'ORM instances   {orm_bytes / (2 * rows):>8.0f} bytes/row')
+        print(f'snapshot        {snapshot_bytes / (2 * rows):>8.0f} bytes/row')
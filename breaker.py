@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from werkzeug.exceptions import ServiceUnavailable
+
+# Circuit Breaker Config
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# Every breaker, by name, for monitoring
+breakers = {}
+
+## Circuit Open Exception
+'''
+CircuitOpenError
+Raised instead of calling a dependency whose breaker is open. It is a 503, so
+handlers that re-raise HTTPExceptions pass it straight to the error handler.
+'''
+class CircuitOpenError(ServiceUnavailable):
+    def __init__(self, name):
+        super().__init__(description=f'{name} is unavailable, try again later.')
+        self.breaker = name
+
+## Circuit Breaker
+'''
+CircuitBreaker
+Counts consecutive failures of a dependency. After `failure_threshold` of
+them the breaker opens and calls fail fast with CircuitOpenError. Once
+`reset_timeout` seconds have passed it goes half-open and lets a single probe
+call through: success closes it again, failure re-opens it.
+'''
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.last_error = None
+        breakers[name] = self
+
+    def before_call(self):
+        # Cheap when closed: no lock on the happy path
+        if self.state == CLOSED:
+            return
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self.probing = False
+            if self.state == OPEN or (self.state == HALF_OPEN and self.probing):
+                raise CircuitOpenError(self.name)
+            if self.state == HALF_OPEN:
+                self.probing = True
+
+    def record_success(self):
+        if self.state == CLOSED and self.failures == 0:
+            return
+        with self.lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.probing = False
+
+    def record_failure(self, error=None):
+        with self.lock:
+            self.failures += 1
+            self.last_error = str(error) if error is not None else None
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.probing = False
+
+    def call(self, fn, *args, **kwargs):
+        self.before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    def status(self, errors=False):
+        # The last error can name hosts and ports, so it is left out unless asked for
+        with self.lock:
+            status = {
+                'state': self.state,
+                'failures': self.failures
+            }
+            if errors:
+                status['last_error'] = self.last_error
+            if self.state == OPEN:
+                status['retry_in'] = round(max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at)), 3)
+            return status
+
+def breaker_status(errors=False):
+    return {name: breaker.status(errors) for name, breaker in breakers.items()}
@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import text
+from models import app, db, Change
+
+# Change Feed Config
+CHANGES_POLL_INTERVAL = float(os.getenv('CHANGES_POLL_INTERVAL', '0.5'))
+CHANGES_MAX_WAIT = float(os.getenv('CHANGES_MAX_WAIT', '30'))
+CHANGES_MAX_LIMIT = int(os.getenv('CHANGES_MAX_LIMIT', '1000'))
+CHANGES_SSE_MAX_DURATION = float(os.getenv('CHANGES_SSE_MAX_DURATION', '300'))
+CHANGES_SSE_HEARTBEAT = float(os.getenv('CHANGES_SSE_HEARTBEAT', '15'))
+CHANGES_RETENTION_DAYS = int(os.getenv('CHANGES_RETENTION_DAYS', '7'))
+CHANGES_RETENTION_ROWS = int(os.getenv('CHANGES_RETENTION_ROWS', '1000000'))
+
+# Postgres advisory lock held by every outbox writer until its transaction ends.
+# Sequence values are handed out at INSERT time but become visible at COMMIT time;
+# serialising the writers makes both orders agree, so a consumer reading
+# "seq > since" can never skip a change that commits late.
+OUTBOX_LOCK_KEY = 7_026_001
+
+# Op of the single change written by a bulk import; consumers reload the entity
+IMPORT_OP = 'import'
+
+# Marker rows left behind by the compaction job
+COMPACT_ENTITY = '*'
+COMPACT_OP = 'compact'
+
+## Serialise outbox writers (released automatically at commit/rollback)
+def lock_outbox():
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:key)'), {'key': OUTBOX_LOCK_KEY})
+
+## Record a change
+def record_change(entity, op, entity_id, data=None):
+    # Must be called inside the write's transaction, before db.session.commit()
+    lock_outbox()
+    db.session.add(Change(
+        entity=entity,
+        entity_id=entity_id,
+        op=op,
+        data=json.dumps(data) if data is not None else None
+    ))
+
+## Read the feed
+def fetch_changes(since, entities, limit):
+    return Change.query \
+        .filter(Change.seq > since, Change.entity.in_(entities)) \
+        .order_by(Change.seq) \
+        .limit(limit) \
+        .all()
+
+def latest_seq():
+    # Newest sequence number (0 on an empty feed); a cursor to start following from
+    return db.session.query(db.func.max(Change.seq)).scalar() or 0
+
+def compacted_through():
+    # Highest sequence number removed by compaction (0 if never compacted)
+    marker = Change.query \
+        .filter(Change.entity == COMPACT_ENTITY, Change.op == COMPACT_OP) \
+        .order_by(Change.seq.desc()) \
+        .first()
+    if marker is None:
+        return 0
+    return json.loads(marker.data)['through']
+
+def wait_for_changes(since, entities, limit, wait):
+    # Long-poll: return as soon as there is something newer than 'since'
+    deadline = time.monotonic() + wait
+    while True:
+        changes = [change.format() for change in fetch_changes(since, entities, limit)]
+
+        # End the read transaction so the next poll sees newly committed rows
+        db.session.close()
+
+        if changes or time.monotonic() >= deadline:
+            return changes
+        time.sleep(CHANGES_POLL_INTERVAL)
+
+def stream_changes(since, entities, limit):
+    # Server-Sent Events. The stream ends after CHANGES_SSE_MAX_DURATION so a
+    # worker is never pinned forever; clients reconnect with Last-Event-ID.
+    started = last_write = time.monotonic()
+    yield f'retry: {int(CHANGES_POLL_INTERVAL * 1000)}\n\n'
+
+    while time.monotonic() - started < CHANGES_SSE_MAX_DURATION:
+        changes = [change.format() for change in fetch_changes(since, entities, limit)]
+        db.session.close()
+
+        for change in changes:
+            since = change['seq']
+            yield f'id: {since}\nevent: change\ndata: {json.dumps(change)}\n\n'
+
+        if changes:
+            last_write = time.monotonic()
+            continue
+
+        if time.monotonic() - last_write >= CHANGES_SSE_HEARTBEAT:
+            last_write = time.monotonic()
+            yield ': keep-alive\n\n'
+        time.sleep(CHANGES_POLL_INTERVAL)
+
+## Retention / Compaction
+def compact_changes(max_age_days=CHANGES_RETENTION_DAYS, max_rows=CHANGES_RETENTION_ROWS, batch_size=10000):
+    last_seq = db.session.query(db.func.max(Change.seq)).scalar()
+    if last_seq is None:
+        return 0
+
+    # Everything older than max_age_days or beyond the newest max_rows goes
+    cutoff = last_seq - max_rows
+    expired = db.session.query(db.func.max(Change.seq)) \
+        .filter(Change.created_at < datetime.utcnow() - timedelta(days=max_age_days)) \
+        .scalar()
+    if expired is not None:
+        cutoff = max(cutoff, expired)
+    if cutoff <= compacted_through():
+        return 0
+
+    # Leave a marker first so consumers behind the cutoff are told to resync
+    record_change(COMPACT_ENTITY, COMPACT_OP, None, {'through': cutoff})
+    db.session.commit()
+
+    # Delete in small batches to keep each transaction (and its locks) short
+    deleted = 0
+    low = db.session.query(db.func.min(Change.seq)).scalar()
+    while low <= cutoff:
+        high = min(low + batch_size - 1, cutoff)
+        deleted += Change.query \
+            .filter(Change.seq >= low, Change.seq <= high) \
+            .delete(synchronize_session=False)
+        db.session.commit()
+        low = high + 1
+
+    return deleted
+
+@app.cli.command('compact-changes')
+@click.option('--max-age-days', default=CHANGES_RETENTION_DAYS, show_default=True,
+              help='Drop changes older than this many days.')
+@click.option('--max-rows', default=CHANGES_RETENTION_ROWS, show_default=True,
+              help='Keep at most this many of the newest changes.')
+@click.option('--batch-size', default=10000, show_default=True,
+              help='Rows deleted per transaction.')
+def compact_changes_command(max_age_days, max_rows, batch_size):
+    """Trim the change feed outbox to its retention window."""
+    deleted = compact_changes(max_age_days, max_rows, batch_size)
+    click.echo(f'Compacted {deleted} change(s).')
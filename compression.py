@@ -0,0 +1,130 @@
+import os
+import zlib
+from flask import request
+from models import app
+
+# Optional codecs, used only when the packages are installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compression Config
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))
+COMPRESS_LEVELS = {
+    'gzip': int(os.getenv('COMPRESS_GZIP_LEVEL', '6')),
+    'br': int(os.getenv('COMPRESS_BR_LEVEL', '4')),
+    'zstd': int(os.getenv('COMPRESS_ZSTD_LEVEL', '3')),
+}
+COMPRESS_MIMETYPES = {'application/json', 'text/event-stream', 'text/plain', 'text/html'}
+
+## Encoders (one instance per response)
+class GzipEncoder:
+    def __init__(self, level):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush=False):
+        # A sync flush pushes out everything so far, so streamed chunks are not held back
+        out = self.compressor.compress(data)
+        return out + self.compressor.flush(zlib.Z_SYNC_FLUSH) if flush else out
+
+    def finish(self):
+        return self.compressor.flush()
+
+class BrotliEncoder:
+    def __init__(self, level):
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data, flush=False):
+        out = self.compressor.process(data)
+        return out + self.compressor.flush() if flush else out
+
+    def finish(self):
+        return self.compressor.finish()
+
+class ZstdEncoder:
+    def __init__(self, level):
+        self.compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data, flush=False):
+        out = self.compressor.compress(data)
+        return out + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if flush else out
+
+    def finish(self):
+        return self.compressor.flush()
+
+# Server preference, best first; ties in the client's q-values go to the earlier entry
+ENCODERS = {}
+if brotli is not None:
+    ENCODERS['br'] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS['zstd'] = ZstdEncoder
+ENCODERS['gzip'] = GzipEncoder
+
+## Per-route levels
+def compress_level(**levels):
+    # e.g. @compress_level(gzip=9, br=6); a level of 0 disables that encoding for the route
+    def compress_level_decorator(f):
+        f.compress_levels = levels
+        return f
+    return compress_level_decorator
+
+def negotiate(levels):
+    offered = [encoding for encoding in ENCODERS if levels.get(encoding, COMPRESS_LEVELS[encoding]) > 0]
+    encoding = request.accept_encodings.best_match(offered)
+    if encoding is None:
+        return None, None
+    return encoding, ENCODERS[encoding](levels.get(encoding, COMPRESS_LEVELS[encoding]))
+
+def compress_stream(chunks, encoder):
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            data = encoder.compress(chunk, flush=True)
+            if data:
+                yield data
+        yield encoder.finish()
+    finally:
+        # Let the wrapped generator (and its stream_with_context) clean up
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+## Compress responses
+@app.after_request
+def compress_response(response):
+
+    # Only successful, not already encoded, text-like bodies
+    if response.status_code < 200 or response.status_code >= 300 or response.status_code == 204 or request.method == 'HEAD':
+        return response
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+
+    # The representation depends on Accept-Encoding from here on
+    response.vary.add('Accept-Encoding')
+
+    # Buffered bodies below the threshold are not worth the CPU
+    if not response.is_streamed and response.calculate_content_length() < COMPRESS_MIN_SIZE:
+        return response
+
+    view = app.view_functions.get(request.endpoint)
+    encoding, encoder = negotiate(getattr(view, 'compress_levels', {}))
+    if encoder is None:
+        return response
+
+    if response.is_streamed:
+        # Streams are compressed chunk by chunk, flushed after each one
+        response.response = compress_stream(response.response, encoder)
+        response.headers.pop('Content-Length', None)
+    else:
+        response.set_data(encoder.compress(response.get_data()) + encoder.finish())
+
+    response.headers['Content-Encoding'] = encoding
+    return response
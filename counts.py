@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+import time
+from sqlalchemy import text
+from models import db, CatalogueStat, normalize_gender
+from stats import META_DIMENSION, META_RECOMPUTED
+
+# Count Config
+COUNT_CACHE_TTL = float(os.getenv('COUNT_CACHE_TTL', '5'))
+COUNT_CACHE_MAX_ENTRIES = int(os.getenv('COUNT_CACHE_MAX_ENTRIES', '1000'))
+COUNT_MODES = ('none', 'exact', 'estimated')
+
+## Exact counts, cached per (table, filter signature)
+_cache = {}
+_cache_lock = threading.Lock()
+
+def signature(entity, filters):
+    return (entity,) + tuple(sorted((name, str(value)) for name, value in filters.items() if value is not None))
+
+def exact_count(entity, filters, query):
+    key = signature(entity, filters)
+    cached = _cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    count = query.order_by(None).count()
+    with _cache_lock:
+        # Crude bound: start over rather than track recency
+        if len(_cache) >= COUNT_CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[key] = (time.monotonic() + COUNT_CACHE_TTL, count)
+    return count
+
+## Estimated counts
+def planner_rows(query):
+    # The planner's row estimate for the filtered query (no COUNT is run)
+    statement = query.order_by(None).statement
+    compiled = statement.compile(dialect=db.engine.dialect)
+    result = db.session.connection().exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}', compiled.params)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+def table_rows(table):
+    # Rows as of the last VACUUM/ANALYZE; -1 (or 0) if the table was never analysed
+    return db.session.execute(
+        text('SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)'),
+        {'table': table}
+    ).scalar()
+
+def counter(dimension, bucket):
+    # A catalogue_stats counter, or None while that table has never been built
+    rows = dict(
+        ((row.dimension, row.bucket), row.count)
+        for row in CatalogueStat.query.filter(db.or_(
+            db.and_(CatalogueStat.dimension == dimension, CatalogueStat.bucket == bucket),
+            db.and_(CatalogueStat.dimension == META_DIMENSION, CatalogueStat.bucket == META_RECOMPUTED)
+        ))
+    )
+    if (META_DIMENSION, META_RECOMPUTED) not in rows:
+        return None
+    return rows.get((dimension, bucket), 0)
+
+def counter_for(entity, filters):
+    # Filters a maintained counter answers exactly: none, or only the actor's gender
+    active = {name: value for name, value in filters.items() if value is not None}
+    if not active:
+        return 'totals', entity
+    if entity == 'actors' and list(active) == ['gender']:
+        return 'actors_by_gender', normalize_gender(active['gender']) or active['gender']
+    return None
+
+def estimated_count(entity, filters, query):
+    if db.engine.dialect.name == 'postgresql':
+        if not any(value is not None for value in filters.values()):
+            rows = table_rows(entity)
+            if rows and rows > 0:
+                return rows
+        else:
+            return planner_rows(query)
+    else:
+        bucket = counter_for(entity, filters)
+        if bucket is not None:
+            count = counter(*bucket)
+            if count is not None:
+                return count
+
+    # Nothing cheaper to go on: fall back to the cached exact count
+    return exact_count(entity, filters, query)
+
+## Total for a list response
+def total_count(mode, entity, filters, query):
+    if mode == 'exact':
+        return exact_count(entity, filters, query)
+    return estimated_count(entity, filters, query)
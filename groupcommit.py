@@ -0,0 +1,152 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from werkzeug.exceptions import ServiceUnavailable
+from models import app, db
+
+# Group Commit Config
+GROUP_COMMIT_ENABLED = os.getenv('GROUP_COMMIT_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+GROUP_COMMIT_WINDOW = float(os.getenv('GROUP_COMMIT_WINDOW', '0.002'))
+GROUP_COMMIT_MAX_OPS = int(os.getenv('GROUP_COMMIT_MAX_OPS', '64'))
+# Seconds a request waits for the writer thread before giving up with a 503
+GROUP_COMMIT_TIMEOUT = float(os.getenv('GROUP_COMMIT_TIMEOUT', '30'))
+
+## Run a write on the request's own session
+def commit_one(op):
+    try:
+        result = op()
+        db.session.commit()
+        return result
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        db.session.close()
+
+## Group Committer
+'''
+GroupCommitter
+A dedicated writer thread that collects write operations for up to `window`
+seconds (or `max_ops` operations) and commits them in one transaction, so
+concurrent writes share a single fsync. Each op runs inside its own SAVEPOINT:
+an op that raises is rolled back alone and its caller gets the exception,
+while the rest of the batch still commits. If the batch COMMIT itself fails,
+the ops are retried one transaction each. An unexpected error in the writer
+thread fails the ops of that batch and the thread carries on with the next.
+
+A caller waits at most `timeout` seconds and then gets a 503. An op still
+queued at that point is dropped; one the writer has already started may
+still commit.
+
+Ops are callables run on the writer thread, so they must use db.session (not
+objects loaded by the request) and return plain data, not ORM instances.
+'''
+class GroupCommitter:
+    def __init__(self, window=GROUP_COMMIT_WINDOW, max_ops=GROUP_COMMIT_MAX_OPS, timeout=GROUP_COMMIT_TIMEOUT):
+        self.window = window
+        self.max_ops = max_ops
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='group-commit', daemon=True)
+                self.thread.start()
+
+    def submit(self, op):
+        self.start()
+        future = Future()
+        self.queue.put((op, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Cancelling only succeeds while the op is still queued
+            future.cancel()
+            raise ServiceUnavailable(description='The write could not be committed in time, try again later.')
+
+    def collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_ops:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        with app.app_context():
+            while True:
+                batch = self.collect()
+                try:
+                    self.commit(batch)
+                except Exception as e:
+                    # Never let the writer thread die: fail this batch and carry on
+                    for op, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    try:
+                        db.session.close()
+                    except Exception:
+                        pass
+
+    def begin(self):
+        # pysqlite only opens a transaction before DML, so the first RELEASE
+        # SAVEPOINT would commit on its own; open the transaction explicitly
+        if db.engine.dialect.name == 'sqlite':
+            db.session.connection().exec_driver_sql('BEGIN')
+
+    def commit(self, batch):
+        # Skip ops whose caller timed out while they were queued
+        batch = [(op, future) for op, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        outcomes = []
+        try:
+            self.begin()
+            for op, future in batch:
+                savepoint = db.session.begin_nested()
+                try:
+                    result = op()
+                    savepoint.commit()
+                    outcomes.append((op, future, result, None))
+                except Exception as e:
+                    savepoint.rollback()
+                    outcomes.append((op, future, None, e))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            db.session.close()
+
+            # Fall back to one transaction per op
+            outcomes = []
+            for op, future in batch:
+                try:
+                    outcomes.append((op, future, commit_one(op), None))
+                except Exception as e:
+                    outcomes.append((op, future, None, e))
+        finally:
+            db.session.close()
+
+        for op, future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+group_committer = GroupCommitter()
+
+## Run a write (the op's return value is passed back to the caller)
+def run_write(op):
+    if GROUP_COMMIT_ENABLED:
+        return group_committer.submit(op)
+    return commit_one(op)
@@ -0,0 +1,248 @@
+import csv
+import io
+import json
+import time
+import click
+from sqlalchemy.dialects import sqlite
+from models import app, db, Movie, Actor, to_date, to_age, normalize_gender, GENDERS
+from changes import record_change, OUTBOX_LOCK_KEY, IMPORT_OP
+from stats import recompute_stats
+
+## Row validation (same rules as the API handlers)
+def clean_movie(row):
+    title = str(row.get('title') or '').strip()
+    if not title or len(title) > Movie.title.type.length:
+        raise ValueError('title is missing or too long')
+    return {
+        'id': int(row['id']) if row.get('id') not in (None, '') else None,
+        'title': title,
+        'release_date': to_date(row.get('release_date'))
+    }
+
+def clean_actor(row):
+    name = str(row.get('name') or '').strip()
+    gender = normalize_gender(row.get('gender'))
+    age = to_age(row.get('age'))
+    if not name or len(name) > Actor.name.type.length:
+        raise ValueError('name is missing or too long')
+    if gender is None:
+        raise ValueError(f'gender must be one of {", ".join(GENDERS)}')
+    return {
+        'id': int(row['id']) if row.get('id') not in (None, '') else None,
+        'name': name,
+        'age': age,
+        'gender': gender
+    }
+
+ENTITIES = {
+    'movies': (Movie, clean_movie),
+    'actors': (Actor, clean_actor),
+}
+
+## Reading
+def read_rows(file, file_format):
+    # (line number, row), one row at a time, so memory does not grow with the file.
+    # NDJSON lines are yielded unparsed: a malformed line is rejected like any invalid row
+    if file_format == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line, text in enumerate(file, start=1):
+        if text.strip():
+            yield line, text
+
+## Import progress
+class ImportReport:
+    def __init__(self, entity, progress_every):
+        self.entity = entity
+        self.progress_every = progress_every
+        self.started = time.monotonic()
+        self.loaded = 0
+        self.rejected = 0
+
+    def rate(self):
+        return self.loaded / max(time.monotonic() - self.started, 1e-9)
+
+    def accept(self):
+        self.loaded += 1
+        if self.progress_every and self.loaded % self.progress_every == 0:
+            click.echo(f'{self.loaded} {self.entity} loaded ({self.rate():.0f} rows/s)', err=True)
+
+    def reject(self, line, error):
+        self.rejected += 1
+        click.echo(f'Line {line}: skipped ({error})', err=True)
+
+def clean_rows(rows, clean, report, strict):
+    for line, row in rows:
+        try:
+            if isinstance(row, str):
+                row = json.loads(row)
+            cleaned = clean(row)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            if strict:
+                raise click.ClickException(f'Line {line}: {e}')
+            report.reject(line, e)
+            continue
+        report.accept()
+        yield cleaned
+
+## Postgres: COPY into a staging table, then merge
+'''
+CopyStream
+File-like object handing COPY ... FROM STDIN the rows as CSV, a buffer at a
+time, so the whole file is never held in memory.
+'''
+class CopyStream:
+    def __init__(self, rows, columns):
+        self.lines = self.encode(rows, columns)
+        self.buffer = b''
+
+    @staticmethod
+    def encode(rows, columns):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        for row in rows:
+            writer.writerow(['' if row[column] is None else row[column] for column in columns])
+            yield out.getvalue().encode()
+            out.seek(0)
+            out.truncate()
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.lines)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+def merge_statements(table, columns, sequence):
+    values = [column for column in columns if column != 'id']
+    updates = ', '.join(f'{column} = EXCLUDED.{column}' for column in values)
+    return [
+        # Rows with an id replace the existing row (the file's last one for a repeated id)
+        f'INSERT INTO {table} ({", ".join(columns)}) '
+        f'SELECT DISTINCT ON (id) {", ".join(columns)} FROM import_staging WHERE id IS NOT NULL '
+        f'ORDER BY id, import_line DESC '
+        f'ON CONFLICT (id) DO UPDATE SET {updates}',
+
+        # Explicit ids do not advance the id sequence: move it past them before drawing new
+        # ids. Only ever forwards, so ids of deleted rows are never handed out again
+        f"SELECT setval('{sequence}', ids.max_id) "
+        f"FROM (SELECT MAX(id) AS max_id FROM {table}) AS ids, {sequence} AS seq "
+        f"WHERE ids.max_id >= seq.last_value + CASE WHEN seq.is_called THEN 1 ELSE 0 END",
+
+        # The others get a new id
+        f'INSERT INTO {table} ({", ".join(values)}) '
+        f'SELECT {", ".join(values)} FROM import_staging WHERE id IS NULL ORDER BY import_line',
+    ]
+
+def copy_rows(model, rows, batch_size, report):
+    table = model.__tablename__
+    columns = [column.name for column in model.__table__.columns]
+
+    connection = db.engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute('SET LOCAL statement_timeout = 0')
+        cursor.execute(f'CREATE TEMP TABLE import_staging (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP')
+        cursor.execute('ALTER TABLE import_staging ALTER COLUMN id DROP NOT NULL')
+        # Numbers the rows in file order, so the last copy of a repeated id wins
+        cursor.execute('ALTER TABLE import_staging ADD COLUMN import_line BIGSERIAL')
+        cursor.copy_expert(
+            f'COPY import_staging ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)',
+            CopyStream(rows, columns),
+            size=batch_size * 64
+        )
+
+        cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', (table, 'id'))
+        sequence = cursor.fetchone()[0]
+        for statement in merge_statements(table, columns, sequence):
+            cursor.execute(statement)
+
+        # Change feed entry in the same transaction as the rows (see record_change)
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', (OUTBOX_LOCK_KEY,))
+        cursor.execute(
+            "INSERT INTO changes (entity, op, data, created_at) VALUES (%s, %s, %s, now() AT TIME ZONE 'utc')",
+            (table, IMPORT_OP, json.dumps({'rows': report.loaded}))
+        )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.close()
+
+## SQLite and others: chunked executemany
+def insert_rows(model, rows, batch_size):
+    table = model.__table__
+    upsert = None
+    if db.engine.dialect.name == 'sqlite':
+        statement = sqlite.insert(table)
+        upsert = statement.on_conflict_do_update(
+            index_elements=[table.c.id],
+            set_={column.name: statement.excluded[column.name] for column in table.columns if column.name != 'id'}
+        )
+
+    def flush(chunk):
+        with_id = [row for row in chunk if row['id'] is not None]
+        without_id = [{key: value for key, value in row.items() if key != 'id'} for row in chunk if row['id'] is None]
+        if with_id:
+            db.session.execute(upsert if upsert is not None else table.insert(), with_id)
+        if without_id:
+            db.session.execute(table.insert(), without_id)
+
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= batch_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+## Import
+def import_catalogue(file, entity, file_format, batch_size=5000, strict=False, progress_every=100000):
+    model, clean = ENTITIES[entity]
+    report = ImportReport(entity, progress_every)
+    rows = clean_rows(read_rows(file, file_format), clean, report, strict)
+
+    # Readers of the change feed (and the snapshot) must reload this entity
+    if db.engine.dialect.name == 'postgresql':
+        copy_rows(model, rows, batch_size, report)
+    else:
+        try:
+            insert_rows(model, rows, batch_size)
+            record_change(entity, IMPORT_OP, None, {'rows': report.loaded})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    # The rows bypassed the incremental counters
+    recompute_stats()
+    return report
+
+@app.cli.command('import-catalogue')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--entity', type=click.Choice(list(ENTITIES)), required=True,
+              help='Table to load the rows into.')
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'ndjson']),
+              help='File format (default: from the file extension).')
+@click.option('--batch-size', default=5000, show_default=True,
+              help='Rows per executemany batch (SQLite) or COPY buffer (Postgres).')
+@click.option('--strict', is_flag=True, help='Stop at the first invalid row instead of skipping it.')
+def import_catalogue_command(file, entity, file_format, batch_size, strict):
+    """Stream a CSV or NDJSON file of movies or actors into the database."""
+    if file_format is None:
+        file_format = 'ndjson' if file.name.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+    report = import_catalogue(file, entity, file_format, batch_size, strict)
+    elapsed = time.monotonic() - report.started
+    click.echo(
+        f'Imported {report.loaded} {entity} in {elapsed:.1f}s '
+        f'({report.rate():.0f} rows/s), {report.rejected} rejected.'
+    )
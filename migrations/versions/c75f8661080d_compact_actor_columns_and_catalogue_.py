@@ -0,0 +1,237 @@
+"""compact actor columns and catalogue indexes
+
+Actor.gender becomes an enum (existing values are normalised first),
+Actor.age a SMALLINT with a range check, and the columns used by the list
+filters get secondary indexes.
+
+On Postgres the upgrade is written to run against a live database, without
+rewriting actors under an exclusive lock (expand, backfill, swap):
+* new age_new/gender_new columns are added (no rewrite) and a trigger keeps
+  them in step with every insert and update from then on;
+* existing rows are backfilled in batches of BATCH_SIZE ids, each committed
+  alone;
+* NOT NULL and the age range are added as NOT VALID checks and validated
+  afterwards, which does not block writes;
+* one short transaction then drops the old columns and renames the new ones
+  into place (catalogue-only changes, no scan); every DDL statement runs with
+  MIGRATION_LOCK_TIMEOUT so it fails fast instead of queueing behind long
+  transactions;
+* indexes are built with CREATE INDEX CONCURRENTLY outside a transaction.
+
+If a step fails, rerun the upgrade: before the swap every step is
+idempotent; once the swap has committed (actors.age is already a SMALLINT)
+the expand/backfill/swap is skipped, and an index left INVALID by a failed
+concurrent build is dropped and built again.
+
+The Postgres downgrade is not online: it changes both column types with one
+ALTER TABLE, which rewrites actors while holding an ACCESS EXCLUSIVE lock
+(reads and writes on actors wait until it finishes). Run it in a
+maintenance window.
+
+Set TITLE_TRIGRAM_INDEX=true to also build a pg_trgm GIN index on
+lower(title), which serves the '?title=' substring filter.
+
+Revision ID: c75f8661080d
+Revises: f22060676e33
+Create Date: 2026-10-19 17:14:42.726844
+
+"""
+import os
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c75f8661080d'
+down_revision = 'f22060676e33'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10000
+LOCK_TIMEOUT = os.getenv('MIGRATION_LOCK_TIMEOUT', '5s')
+TITLE_TRIGRAM_INDEX = os.getenv('TITLE_TRIGRAM_INDEX', 'false').lower() in ('1', 'true', 'yes')
+
+GENDERS = ('Male', 'Female', 'Other')
+MIN_AGE = 0
+MAX_AGE = 150
+AGE_CHECK = f'age >= {MIN_AGE} AND age <= {MAX_AGE}'
+
+INDEXES = [
+    ('ix_movies_release_date', 'movies', '(release_date)'),
+    ('ix_movies_title', 'movies', '(title)'),
+    ('ix_movies_title_lower', 'movies', '(lower(title))'),
+    ('ix_actors_gender_age', 'actors', '(gender, age)'),
+]
+
+# Map free-text genders onto the enum and clamp ages into range
+FIX_ACTORS = sa.text(f"""
+    UPDATE actors SET
+        gender = CASE
+            WHEN gender IN ('Male', 'Female', 'Other') THEN gender
+            WHEN lower(trim(gender)) IN ('male', 'm') THEN 'Male'
+            WHEN lower(trim(gender)) IN ('female', 'f') THEN 'Female'
+            ELSE 'Other'
+        END,
+        age = CASE
+            WHEN age < {MIN_AGE} THEN {MIN_AGE}
+            WHEN age > {MAX_AGE} THEN {MAX_AGE}
+            ELSE age
+        END
+    WHERE id BETWEEN :low AND :high
+      AND (gender NOT IN ('Male', 'Female', 'Other') OR age < {MIN_AGE} OR age > {MAX_AGE})
+""")
+
+
+# Postgres expand/backfill/swap
+CREATE_GENDER_TYPE = f"""
+    DO $$ BEGIN
+        CREATE TYPE actor_gender AS ENUM ({', '.join(repr(gender) for gender in GENDERS)});
+    EXCEPTION WHEN duplicate_object THEN NULL;
+    END $$
+"""
+
+# Same normalisation as FIX_ACTORS, applied to every row written during the migration
+SYNC_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION actors_sync_compact_columns() RETURNS trigger AS $$
+    BEGIN
+        NEW.age_new := LEAST(GREATEST(NEW.age, {MIN_AGE}), {MAX_AGE});
+        NEW.gender_new := CASE
+            WHEN NEW.gender IN ('Male', 'Female', 'Other') THEN NEW.gender
+            WHEN lower(trim(NEW.gender)) IN ('male', 'm') THEN 'Male'
+            WHEN lower(trim(NEW.gender)) IN ('female', 'f') THEN 'Female'
+            ELSE 'Other'
+        END::actor_gender;
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+BACKFILL_ACTORS = sa.text('UPDATE actors SET age = age WHERE id BETWEEN :low AND :high AND gender_new IS NULL')
+
+NEW_CHECKS = [
+    ('ck_actors_age_new_not_null', 'age_new IS NOT NULL'),
+    ('ck_actors_gender_new_not_null', 'gender_new IS NOT NULL'),
+    ('ck_actors_age_range', AGE_CHECK.replace('age', 'age_new')),
+]
+
+
+def batches(bind):
+    low, high = bind.execute(sa.text('SELECT MIN(id), MAX(id) FROM actors')).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, BATCH_SIZE):
+        yield {'low': start, 'high': start + BATCH_SIZE - 1}
+
+
+def backfill_actors(bind):
+    for batch in batches(bind):
+        bind.execute(BACKFILL_ACTORS, batch)
+
+
+def fix_actors(bind):
+    for batch in batches(bind):
+        bind.execute(FIX_ACTORS, batch)
+
+
+def columns_swapped(bind):
+    # A rerun after the swap committed (e.g. an index build failed) must not expand again
+    return bind.execute(sa.text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = 'actors' AND column_name = 'age'"
+    )).scalar() == 'smallint'
+
+def drop_invalid_index(bind, name):
+    # A failed CREATE INDEX CONCURRENTLY leaves an INVALID index that IF NOT EXISTS would keep
+    invalid = bind.execute(sa.text(
+        'SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)'
+    ), {'name': name}).scalar()
+    if invalid:
+        op.execute(f'DROP INDEX CONCURRENTLY {name}')
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name != 'postgresql':
+        fix_actors(bind)
+        with op.batch_alter_table('actors', recreate='always') as batch_op:
+            batch_op.alter_column('age', existing_type=sa.Integer(), type_=sa.SmallInteger(), existing_nullable=False)
+            batch_op.alter_column('gender', existing_type=sa.String(length=10),
+                                  type_=sa.Enum(*GENDERS, name='actor_gender', create_constraint=True),
+                                  existing_nullable=False)
+            batch_op.create_check_constraint('ck_actors_age_range', AGE_CHECK)
+        for name, table, columns in INDEXES:
+            op.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {table} {columns}')
+        return
+
+    if not columns_swapped(bind):
+        with op.get_context().autocommit_block():
+            op.execute(f"SET lock_timeout = '{LOCK_TIMEOUT}'")
+
+            # Expand: nullable columns without a default are added without a rewrite
+            op.execute(CREATE_GENDER_TYPE)
+            op.execute('ALTER TABLE actors ADD COLUMN IF NOT EXISTS age_new SMALLINT, '
+                       'ADD COLUMN IF NOT EXISTS gender_new actor_gender')
+            op.execute(SYNC_FUNCTION)
+            op.execute('DROP TRIGGER IF EXISTS actors_sync_compact_columns ON actors')
+            op.execute('CREATE TRIGGER actors_sync_compact_columns BEFORE INSERT OR UPDATE ON actors '
+                       'FOR EACH ROW EXECUTE FUNCTION actors_sync_compact_columns()')
+
+            # Backfill: a no-op update per batch fires the trigger on the existing rows
+            backfill_actors(op.get_bind())
+
+            # Checks added NOT VALID take a brief lock; validating them does not block writes
+            for name, check in NEW_CHECKS:
+                op.execute(f'ALTER TABLE actors DROP CONSTRAINT IF EXISTS {name}')
+                op.execute(f'ALTER TABLE actors ADD CONSTRAINT {name} CHECK ({check}) NOT VALID')
+            op.execute('RESET lock_timeout')
+            for name, check in NEW_CHECKS:
+                op.execute(f'ALTER TABLE actors VALIDATE CONSTRAINT {name}')
+
+        # Swap, in one short transaction: no step scans or rewrites the table
+        # (SET NOT NULL uses the validated checks instead of a scan)
+        op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+        op.execute('DROP TRIGGER actors_sync_compact_columns ON actors')
+        op.execute('DROP FUNCTION actors_sync_compact_columns()')
+        op.execute('ALTER TABLE actors DROP COLUMN age, DROP COLUMN gender')
+        op.execute('ALTER TABLE actors RENAME COLUMN age_new TO age')
+        op.execute('ALTER TABLE actors RENAME COLUMN gender_new TO gender')
+        op.execute('ALTER TABLE actors ALTER COLUMN age SET NOT NULL, ALTER COLUMN gender SET NOT NULL, '
+                   'DROP CONSTRAINT ck_actors_age_new_not_null, DROP CONSTRAINT ck_actors_gender_new_not_null')
+
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            drop_invalid_index(bind, name)
+            op.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} {columns}')
+        if TITLE_TRIGRAM_INDEX:
+            op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            drop_invalid_index(bind, 'ix_movies_title_trgm')
+            op.execute('CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_movies_title_trgm '
+                       'ON movies USING gin (lower(title) gin_trgm_ops)')
+
+
+def downgrade():
+    bind = op.get_bind()
+
+    if bind.dialect.name != 'postgresql':
+        for name, table, columns in reversed(INDEXES):
+            op.execute(f'DROP INDEX IF EXISTS {name}')
+        with op.batch_alter_table('actors', recreate='always') as batch_op:
+            batch_op.drop_constraint('ck_actors_age_range', type_='check')
+            batch_op.alter_column('gender', existing_type=sa.Enum(*GENDERS, name='actor_gender', create_constraint=True),
+                                  type_=sa.String(length=10), existing_nullable=False)
+            batch_op.alter_column('age', existing_type=sa.SmallInteger(), type_=sa.Integer(), existing_nullable=False)
+        return
+
+    with op.get_context().autocommit_block():
+        op.execute('DROP INDEX CONCURRENTLY IF EXISTS ix_movies_title_trgm')
+        for name, table, columns in reversed(INDEXES):
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+    # Not online: rewrites actors under an ACCESS EXCLUSIVE lock (see the module docstring)
+    op.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'")
+    op.execute('ALTER TABLE actors DROP CONSTRAINT IF EXISTS ck_actors_age_range')
+    op.execute('ALTER TABLE actors '
+               'ALTER COLUMN gender TYPE VARCHAR(10) USING gender::text, '
+               'ALTER COLUMN age TYPE INTEGER')
+    op.execute('DROP TYPE actor_gender')
@@ -1,8 +1,13 @@
 from dotenv import load_dotenv
+import json
 import os
+from datetime import datetime
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, make_url
+from breaker import CircuitBreaker, CircuitOpenError
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,22 +17,117 @@ database_url = os.getenv("DATABASE_URL")
 flask_app = os.getenv("FLASK_APP")
 flask_env = os.getenv("FLASK_ENV")
 
+# Date format used by the API for release dates
+DATE_FORMAT = '%Y-%m-%d'
+
+# Convert a YYYY-MM-DD string to a date (raises ValueError/TypeError otherwise)
+def to_date(date_str):
+    return datetime.strptime(date_str, DATE_FORMAT).date()
+
+# Allowed actor genders and age range
+GENDERS = ('Male', 'Female', 'Other')
+MIN_AGE = 0
+MAX_AGE = 150
+
+# Canonical spelling of a gender (case-insensitive), or None if it is not one of GENDERS
+def normalize_gender(gender):
+    if not isinstance(gender, str):
+        return None
+    return {allowed.lower(): allowed for allowed in GENDERS}.get(gender.strip().lower())
+
+# Convert an age (int or digit string) to an int in range (raises ValueError otherwise)
+def to_age(age):
+    if isinstance(age, bool) or not isinstance(age, (int, str)) or not str(age).strip().isdigit():
+        raise ValueError(f'age must be a whole number between {MIN_AGE} and {MAX_AGE}')
+    age = int(age)
+    if not MIN_AGE <= age <= MAX_AGE:
+        raise ValueError(f'age must be a whole number between {MIN_AGE} and {MAX_AGE}')
+    return age
+
+# Database timeouts (Postgres), so a slow database cannot hold every worker thread
+DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', '5'))  # seconds
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', '15000'))  # milliseconds, 0 disables
+
+# Postgres error code of a statement cancelled by statement_timeout
+QUERY_CANCELED = '57014'
+
+def with_timeouts(url):
+    # Passed to libpq through the URL, unless the URL already sets them
+    if not url or not make_url(url).drivername.startswith('postgres'):
+        return url
+    parsed = make_url(url)
+    query = {'connect_timeout': str(DB_CONNECT_TIMEOUT)}
+    if DB_STATEMENT_TIMEOUT:
+        query['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+    query.update(parsed.query)
+    return parsed.update_query_dict(query, append=False).render_as_string(hide_password=False)
+
 # App & DB Config
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+app.config['SQLALCHEMY_DATABASE_URI'] = with_timeouts(database_url)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['FLASK_APP'] = flask_app
 app.config['FLASK_ENV'] = flask_env
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
+## Lift the statement timeout for the rest of the transaction (bulk jobs)
+def no_statement_timeout():
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text('SET LOCAL statement_timeout = 0'))
+
+## Database circuit breaker (fails fast with a 503 while the database is down)
+db_breaker = CircuitBreaker('database')
+
+def is_outage(context):
+    # Refused or lost connections and statement timeouts; not bad SQL or constraint errors
+    return context.connection is None or context.is_disconnect \
+        or getattr(context.original_exception, 'pgcode', None) == QUERY_CANCELED
+
+@event.listens_for(Engine, 'do_connect')
+def check_breaker_before_connect(dialect, connection_record, cargs, cparams):
+    db_breaker.before_call()
+
+@event.listens_for(Engine, 'connect')
+def close_breaker_on_connect(dbapi_connection, connection_record):
+    db_breaker.record_success()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def check_breaker_before_execute(connection, cursor, statement, parameters, context, executemany):
+    db_breaker.before_call()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def close_breaker_after_execute(connection, cursor, statement, parameters, context, executemany):
+    db_breaker.record_success()
+
+@event.listens_for(Engine, 'handle_error')
+def count_database_failure(context):
+    # Only errors the database reported; the breaker's own fail-fast is not one
+    if context.sqlalchemy_exception is None or isinstance(context.original_exception, CircuitOpenError):
+        return
+    if is_outage(context):
+        db_breaker.record_failure(context.original_exception)
+    else:
+        db_breaker.record_success()
+
 # Movie Model
 class Movie(db.Model):
     __tablename__ = 'movies'
+    # Case-insensitive title search filters on lower(title)
+    __table_args__ = (
+        db.Index('ix_movies_title_lower', db.func.lower(db.text('title'))),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(120), nullable=False)
-    release_date = db.Column(db.Date, nullable=False)
+    title = db.Column(db.String(120), nullable=False, index=True)
+    release_date = db.Column(db.Date, nullable=False, index=True)
+
+    def format(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'release_date': self.release_date.strftime(DATE_FORMAT)
+        }
 
     def __repr__(self):
         return f"<Movie {self.title}>"
@@ -35,16 +135,61 @@ class Movie(db.Model):
 # Actor Model
 class Actor(db.Model):
     __tablename__ = 'actors'
+    __table_args__ = (
+        db.CheckConstraint(f'age >= {MIN_AGE} AND age <= {MAX_AGE}', name='ck_actors_age_range'),
+        db.Index('ix_actors_gender_age', 'gender', 'age'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
-    age = db.Column(db.Integer, nullable=False)
-    gender = db.Column(db.String(10), nullable=False)
+    age = db.Column(db.SmallInteger, nullable=False)
+    gender = db.Column(db.Enum(*GENDERS, name='actor_gender', create_constraint=True), nullable=False)
+
+    def format(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'age': self.age,
+            'gender': self.gender
+        }
 
     def __repr__(self):
         return f"<Actor {self.name}>"
 
+# Change Model (transactional outbox of every write to movies and actors)
+class Change(db.Model):
+    __tablename__ = 'changes'
+    # AUTOINCREMENT on SQLite so compacted sequence numbers are never reused
+    __table_args__ = {'sqlite_autoincrement': True}
+
+    seq = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=True)
+    op = db.Column(db.String(10), nullable=False)
+    data = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
 
+    def format(self):
+        return {
+            'seq': self.seq,
+            'entity': self.entity,
+            'entity_id': self.entity_id,
+            'op': self.op,
+            'data': json.loads(self.data) if self.data else None,
+            'created_at': self.created_at.strftime('%Y-%m-%dT%H:%M:%SZ')
+        }
 
+    def __repr__(self):
+        return f"<Change {self.seq} {self.op} {self.entity}/{self.entity_id}>"
 
+# Catalogue Stat Model (summary counts maintained by the write handlers)
+class CatalogueStat(db.Model):
+    __tablename__ = 'catalogue_stats'
 
+    dimension = db.Column(db.String(30), primary_key=True)
+    bucket = db.Column(db.String(30), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<CatalogueStat {self.dimension}/{self.bucket}={self.count}>"
@@ -0,0 +1,200 @@
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import request, g
+from models import app
+
+# Profiling Config
+PROFILE_PERMISSION = 'profile:requests'
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'casting-agency-profiles'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.001'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))
+# Route sampling, e.g. "get_movies=1000,get_actors=1000" profiles 1 request in 1000
+PROFILE_SAMPLE_RATES = {
+    endpoint.strip(): int(rate)
+    for endpoint, rate in (item.split('=') for item in os.getenv('PROFILE_SAMPLE_RATES', '').split(',') if item.strip())
+}
+_sample_counters = {endpoint: itertools.count(1) for endpoint in PROFILE_SAMPLE_RATES}
+
+PROFILE_ID = re.compile(r'^[0-9a-f]{32}$')
+
+## Stack Sampler
+'''
+StackSampler
+Records the call stack of one thread every `interval` seconds from a
+background thread. Samples are kept as collapsed stacks ("outer;inner" ->
+count), the input format of flamegraph.pl and speedscope.
+'''
+class StackSampler:
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        if stack:
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+## Output formats
+def to_speedscope(collapsed, name, interval):
+    frames, index, samples, weights = [], {}, [], []
+    for line in collapsed.splitlines():
+        stack, count = line.rsplit(' ', 1)
+        sample = []
+        for frame in stack.split(';'):
+            if frame not in index:
+                index[frame] = len(frames)
+                frames.append({'name': frame})
+            sample.append(index[frame])
+        samples.append(sample)
+        weights.append(int(count) * interval)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'name': name,
+        'exporter': 'casting-agency',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': sum(weights),
+            'samples': samples,
+            'weights': weights
+        }]
+    }
+
+def pstats_report(path):
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(60)
+    return out.getvalue()
+
+## Deciding whether to profile (a header lookup for every other request)
+def profile_requested():
+    return request.headers.get('X-Profile')
+
+def profile_mode():
+    requested = profile_requested()
+    if requested:
+        return 'cprofile' if requested.lower() == 'cprofile' else 'sample'
+    if PROFILE_SAMPLE_RATES and request.endpoint in PROFILE_SAMPLE_RATES:
+        if next(_sample_counters[request.endpoint]) % PROFILE_SAMPLE_RATES[request.endpoint] == 0:
+            return 'sample'
+    return None
+
+## Profile a call
+def profile_call(mode, fn, *args, **kwargs):
+    # The caller passes everything from token decoding to jsonify() in `fn`
+    profile_id = uuid.uuid4().hex
+    g.profiling = mode
+    started = time.monotonic()
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = StackSampler(threading.get_ident())
+        profiler.start()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if mode == 'cprofile':
+            profiler.disable()
+        else:
+            profiler.stop()
+
+        # Only a caller holding the profiling permission gets to keep a requested profile
+        if g.get('profile_allowed', False) or not profile_requested():
+            save_profile(profile_id, mode, profiler, {
+                'endpoint': request.endpoint,
+                'path': request.full_path,
+                'seconds': round(time.monotonic() - started, 6)
+            })
+            g.profile_id = profile_id
+
+## Storage
+def profile_path(profile_id, extension):
+    return os.path.join(PROFILE_DIR, f'{profile_id}.{extension}')
+
+def save_profile(profile_id, mode, profiler, meta):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    if mode == 'cprofile':
+        profiler.dump_stats(profile_path(profile_id, 'prof'))
+    else:
+        with open(profile_path(profile_id, 'collapsed'), 'w') as file:
+            file.write(profiler.collapsed())
+    with open(profile_path(profile_id, 'json'), 'w') as file:
+        json.dump(dict(meta, id=profile_id, mode=mode, interval=PROFILE_INTERVAL), file)
+    prune_profiles()
+
+def prune_profiles():
+    # Keep the newest PROFILE_KEEP profiles
+    metas = sorted(
+        (entry for entry in os.scandir(PROFILE_DIR) if entry.name.endswith('.json')),
+        key=lambda entry: entry.stat().st_mtime
+    )
+    for entry in metas[:max(0, len(metas) - PROFILE_KEEP)]:
+        profile_id = entry.name[:-len('.json')]
+        for extension in ('json', 'collapsed', 'prof'):
+            try:
+                os.remove(profile_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+def load_profile(profile_id, output_format):
+    # Returns (body, mimetype), or None if there is no such profile
+    if not PROFILE_ID.match(profile_id) or not os.path.exists(profile_path(profile_id, 'json')):
+        return None
+    with open(profile_path(profile_id, 'json')) as file:
+        meta = json.load(file)
+
+    if meta['mode'] == 'cprofile':
+        if output_format == 'pstats':
+            with open(profile_path(profile_id, 'prof'), 'rb') as file:
+                return file.read(), 'application/octet-stream'
+        return pstats_report(profile_path(profile_id, 'prof')), 'text/plain'
+
+    with open(profile_path(profile_id, 'collapsed')) as file:
+        collapsed = file.read()
+    if output_format == 'speedscope':
+        name = f"{meta['path']} ({meta['seconds'] * 1000:.1f} ms)"
+        return json.dumps(to_speedscope(collapsed, name, meta['interval'])), 'application/json'
+    return collapsed, 'text/plain'
+
+## Tell the caller where the profile went (error responses included)
+@app.after_request
+def add_profile_id(response):
+    if g.get('profile_id'):
+        response.headers['X-Profile-Id'] = g.profile_id
+    return response
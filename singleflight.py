@@ -0,0 +1,81 @@
+import os
+import threading
+from functools import wraps
+from flask import request, make_response, Response, g
+
+# Single-Flight Config
+SINGLEFLIGHT_ENABLED = os.getenv('SINGLEFLIGHT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+## In-flight call shared by every request with the same key
+class Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+## Single-Flight Group
+'''
+SingleFlight
+Concurrent calls with the same key share one execution: the first caller
+(the leader) runs the function, the others wait and get its result or its
+exception. Nothing is kept once the leader finishes, so this only merges
+requests that overlap in time; it is not a cache.
+'''
+class SingleFlight:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = Call()
+
+        # Follower: wait for the leader and share its outcome
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        # Leader: run it, then release the key before waking the followers
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+        return call.result
+
+read_flights = SingleFlight()
+
+## Coalesce identical concurrent reads
+def coalesce(f):
+    # Goes below @requires_auth. The key includes the caller's permissions so
+    # requests from different authorization scopes are never merged.
+    @wraps(f)
+    def wrapper(jwt_payload, *args, **kwargs):
+        # A profiled request runs its own handler rather than waiting on someone else's
+        if not SINGLEFLIGHT_ENABLED or g.get('profiling'):
+            return f(jwt_payload, *args, **kwargs)
+
+        key = (
+            request.endpoint,
+            tuple(sorted(kwargs.items())),
+            tuple(sorted(request.args.items(multi=True))),
+            tuple(sorted(set(jwt_payload.get('permissions', []))))
+        )
+
+        # Share the serialized body, never the ORM objects or the Response itself
+        def fetch():
+            response = make_response(f(jwt_payload, *args, **kwargs))
+            return response.get_data(), response.status_code, list(response.headers)
+
+        body, status, headers = read_flights.do(key, fetch)
+        return Response(body, status=status, headers=headers)
+    return wrapper
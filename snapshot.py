@@ -0,0 +1,214 @@
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import date
+from models import db, Movie, Actor, Change, normalize_gender
+from changes import fetch_changes, compacted_through, IMPORT_OP
+
+# Snapshot Config
+SNAPSHOT_ENABLED = os.getenv('SNAPSHOT_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+SNAPSHOT_REFRESH_INTERVAL = float(os.getenv('SNAPSHOT_REFRESH_INTERVAL', '1.0'))
+SNAPSHOT_REFRESH_BATCH = int(os.getenv('SNAPSHOT_REFRESH_BATCH', '5000'))
+
+## Column Table
+'''
+ColumnTable
+Rows stored as parallel columns kept sorted by id: ids in an array('q'),
+every other column either a typed array or a list of interned strings.
+'''
+class ColumnTable:
+    def __init__(self, **columns):
+        # columns: name -> array typecode, or None for a list of interned strings
+        self.typecodes = columns
+        self.ids = array('q')
+        self.columns = {name: array(code) if code else [] for name, code in columns.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def upsert(self, row_id, values):
+        values = {name: sys.intern(str(value)) if self.typecodes[name] is None else value for name, value in values.items()}
+        index = bisect_left(self.ids, row_id)
+        if index < len(self.ids) and self.ids[index] == row_id:
+            for name, column in self.columns.items():
+                column[index] = values[name]
+            return
+
+        # New ids are almost always the largest, which makes this an append
+        self.ids.insert(index, row_id)
+        for name, column in self.columns.items():
+            column.insert(index, values[name])
+
+    def delete(self, row_id):
+        index = bisect_left(self.ids, row_id)
+        if index < len(self.ids) and self.ids[index] == row_id:
+            del self.ids[index]
+            for column in self.columns.values():
+                del column[index]
+
+def movie_table():
+    return ColumnTable(title=None, release_date='i')
+
+def actor_table():
+    return ColumnTable(name=None, age='h', gender=None)
+
+## Catalogue Snapshot
+'''
+CatalogueSnapshot
+In-process, read-only copy of the movies and actors tables used to serve the
+list endpoints without hydrating ORM objects. It is loaded once and then kept
+up to date by replaying the change feed from its high-water mark (the last
+applied Change.seq); if that history has been compacted it reloads in full.
+'''
+class CatalogueSnapshot:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.seq = None
+        self.refreshed_at = 0.0
+        self.movies = movie_table()
+        self.actors = actor_table()
+
+    ## Loading
+    def load(self):
+        # Read the high-water mark first: replaying from it afterwards is idempotent
+        seq = db.session.query(db.func.max(Change.seq)).scalar() or 0
+        movies = movie_table()
+        actors = actor_table()
+
+        # Plain column tuples, no ORM instances
+        for row_id, title, release_date in db.session.query(Movie.id, Movie.title, Movie.release_date) \
+                .order_by(Movie.id).yield_per(SNAPSHOT_REFRESH_BATCH):
+            movies.upsert(row_id, {'title': title, 'release_date': release_date.toordinal()})
+        for row_id, name, age, gender in db.session.query(Actor.id, Actor.name, Actor.age, Actor.gender) \
+                .order_by(Actor.id).yield_per(SNAPSHOT_REFRESH_BATCH):
+            actors.upsert(row_id, {'name': name, 'age': age, 'gender': gender})
+
+        with self.lock:
+            self.movies, self.actors, self.seq = movies, actors, seq
+
+    def apply(self, change):
+        table = self.movies if change['entity'] == 'movies' else self.actors
+        if change['op'] == 'delete':
+            table.delete(change['entity_id'])
+            return
+
+        data = change['data']
+        if change['entity'] == 'movies':
+            table.upsert(data['id'], {
+                'title': data['title'],
+                'release_date': date.fromisoformat(data['release_date']).toordinal()
+            })
+        else:
+            table.upsert(data['id'], {'name': data['name'], 'age': int(data['age']), 'gender': data['gender']})
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self.refreshed_at < SNAPSHOT_REFRESH_INTERVAL:
+            return
+
+        # One refresher at a time; everyone else keeps serving the current data
+        if not self.refresh_lock.acquire(blocking=self.seq is None):
+            return
+        try:
+            if self.seq is None or self.seq < compacted_through():
+                self.load()
+            while True:
+                changes = [change.format() for change in fetch_changes(self.seq, ['movies', 'actors'], SNAPSHOT_REFRESH_BATCH)]
+                if not changes:
+                    break
+
+                # A bulk import is a single entry standing for many rows
+                if any(change['op'] == IMPORT_OP for change in changes):
+                    self.load()
+                    continue
+                with self.lock:
+                    for change in changes:
+                        self.apply(change)
+                    self.seq = changes[-1]['seq']
+            self.refreshed_at = time.monotonic()
+        finally:
+            db.session.close()
+            self.refresh_lock.release()
+
+    ## Queries (same filters and ordering as the database path; call with self.lock held)
+    def movie_matches(self, filters):
+        title = filters.get('title')
+        title = title.lower() if title else None
+        after = filters['released_after'].toordinal() if filters.get('released_after') else None
+        before = filters['released_before'].toordinal() if filters.get('released_before') else None
+
+        ids, titles, dates = self.movies.ids, self.movies.columns['title'], self.movies.columns['release_date']
+        return (
+            index for index in range(len(ids))
+            if (after is None or dates[index] >= after)
+            and (before is None or dates[index] <= before)
+            and (title is None or title in titles[index].lower())
+        )
+
+    def actor_matches(self, filters):
+        name = filters.get('name')
+        name = name.lower() if name else None
+        gender, min_age, max_age = filters.get('gender'), filters.get('min_age'), filters.get('max_age')
+        # Same spelling rule as the API; an unknown value matches nothing
+        gender = (normalize_gender(gender) or gender) if gender is not None else None
+
+        ids = self.actors.ids
+        names, ages, genders = (self.actors.columns[column] for column in ('name', 'age', 'gender'))
+        return (
+            index for index in range(len(ids))
+            if (gender is None or genders[index] == gender)
+            and (min_age is None or ages[index] >= min_age)
+            and (max_age is None or ages[index] <= max_age)
+            and (name is None or name in names[index].lower())
+        )
+
+    def query_movies(self, filters, offset=0, limit=None):
+        with self.lock:
+            ids, titles, dates = self.movies.ids, self.movies.columns['title'], self.movies.columns['release_date']
+            return [
+                {
+                    'id': ids[index],
+                    'title': titles[index],
+                    'release_date': date.fromordinal(dates[index]).isoformat()
+                }
+                for index in _window(self.movie_matches(filters), offset, limit)
+            ]
+
+    def query_actors(self, filters, offset=0, limit=None):
+        with self.lock:
+            ids = self.actors.ids
+            names, ages, genders = (self.actors.columns[column] for column in ('name', 'age', 'gender'))
+            return [
+                {
+                    'id': ids[index],
+                    'name': names[index],
+                    'age': ages[index],
+                    'gender': genders[index]
+                }
+                for index in _window(self.actor_matches(filters), offset, limit)
+            ]
+
+    ## Counts (exact; no filter is just the table length)
+    def count_movies(self, filters):
+        with self.lock:
+            if not any(filters.values()):
+                return len(self.movies)
+            return sum(1 for _ in self.movie_matches(filters))
+
+    def count_actors(self, filters):
+        with self.lock:
+            if all(value is None for value in filters.values()):
+                return len(self.actors)
+            return sum(1 for _ in self.actor_matches(filters))
+
+def _window(indices, offset, limit):
+    for position, index in enumerate(indices):
+        if limit is not None and position >= offset + limit:
+            return
+        if position >= offset:
+            yield index
+
+catalogue_snapshot = CatalogueSnapshot()
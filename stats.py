@@ -0,0 +1,151 @@
+import os
+import time
+from bisect import bisect_right
+from datetime import datetime
+import click
+from sqlalchemy.dialects import postgresql, sqlite
+from models import app, db, Movie, Actor, CatalogueStat, no_statement_timeout
+from changes import lock_outbox
+
+# Stats Config
+STATS_CACHE_MAX_AGE = float(os.getenv('STATS_CACHE_MAX_AGE', '300'))
+
+# Lower bound of each actor age bucket
+AGE_BUCKETS = (0, 18, 25, 35, 45, 55, 65)
+
+# Bookkeeping row whose updated_at is the time of the last full recompute
+META_DIMENSION = 'meta'
+META_RECOMPUTED = 'recomputed'
+
+# Last /stats answer per set of readable entities, for ?max_age= requests
+_cache = {}
+
+## Buckets
+def age_bucket(age):
+    index = max(bisect_right(AGE_BUCKETS, age) - 1, 0)
+    if index + 1 < len(AGE_BUCKETS):
+        return f'{AGE_BUCKETS[index]}-{AGE_BUCKETS[index + 1] - 1}'
+    return f'{AGE_BUCKETS[index]}+'
+
+def buckets(entity, data):
+    # (dimension, bucket) pairs a single formatted movie/actor contributes to
+    if entity == 'movies':
+        return [
+            ('totals', 'movies'),
+            ('movies_by_year', data['release_date'][:4])
+        ]
+    return [
+        ('totals', 'actors'),
+        ('actors_by_gender', str(data['gender'])),
+        ('actors_by_age', age_bucket(int(data['age'])))
+    ]
+
+## Incremental maintenance
+def _increment(dimension, bucket, delta, now):
+    table = CatalogueStat.__table__
+    dialect = db.engine.dialect.name
+
+    # Single-statement upsert where the dialect has one
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        statement = insert(table).values(dimension=dimension, bucket=bucket, count=delta, updated_at=now)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c.dimension, table.c.bucket],
+            set_={'count': table.c.count + delta, 'updated_at': now}
+        ))
+        return
+
+    result = db.session.execute(
+        table.update()
+        .where(table.c.dimension == dimension, table.c.bucket == bucket)
+        .values(count=table.c.count + delta, updated_at=now)
+    )
+    if result.rowcount == 0:
+        db.session.execute(table.insert().values(dimension=dimension, bucket=bucket, count=delta, updated_at=now))
+
+def update_stats(entity, before=None, after=None):
+    # Must be called inside the write's transaction, before db.session.commit()
+    deltas = {}
+    for key in buckets(entity, before) if before else []:
+        deltas[key] = deltas.get(key, 0) - 1
+    for key in buckets(entity, after) if after else []:
+        deltas[key] = deltas.get(key, 0) + 1
+
+    now = datetime.utcnow()
+    for (dimension, bucket), delta in sorted(deltas.items()):
+        if delta:
+            _increment(dimension, bucket, delta, now)
+
+## Full recompute (corrects any drift)
+def recompute_stats():
+    # Block the write handlers for the duration so no delta is lost or counted twice
+    lock_outbox()
+    no_statement_timeout()
+    CatalogueStat.query.delete(synchronize_session=False)
+
+    rows = [('totals', 'movies', Movie.query.count()), ('totals', 'actors', Actor.query.count())]
+
+    year = db.extract('year', Movie.release_date)
+    for value, count in db.session.query(year, db.func.count()).group_by(year):
+        rows.append(('movies_by_year', str(int(value)), count))
+
+    for value, count in db.session.query(Actor.gender, db.func.count()).group_by(Actor.gender):
+        rows.append(('actors_by_gender', str(value), count))
+
+    age = db.case(
+        *[(Actor.age >= low, age_bucket(low)) for low in reversed(AGE_BUCKETS[1:])],
+        else_=age_bucket(AGE_BUCKETS[0])
+    )
+    for value, count in db.session.query(age, db.func.count()).group_by(age):
+        rows.append(('actors_by_age', value, count))
+
+    now = datetime.utcnow()
+    rows.append((META_DIMENSION, META_RECOMPUTED, 0))
+    db.session.execute(CatalogueStat.__table__.insert(), [
+        {'dimension': dimension, 'bucket': bucket, 'count': count, 'updated_at': now}
+        for dimension, bucket, count in rows
+    ])
+    db.session.commit()
+    _cache.clear()
+
+@app.cli.command('recompute-stats')
+def recompute_stats_command():
+    """Rebuild the catalogue_stats summary table from the movies and actors tables."""
+    recompute_stats()
+    click.echo('Catalogue stats recomputed.')
+
+## Read
+def _visible(dimension, bucket, entities):
+    if dimension == 'totals':
+        return bucket in entities
+    return dimension.split('_by_')[0] in entities
+
+def read_stats(entities):
+    stats = {}
+    recomputed_at = None
+    for row in CatalogueStat.query.all():
+        if row.dimension == META_DIMENSION:
+            recomputed_at = row.updated_at
+        elif row.count and _visible(row.dimension, row.bucket, entities):
+            stats.setdefault(row.dimension, {})[row.bucket] = row.count
+
+    # Never recomputed (recomputed_at: null): the counters only hold the writes made since
+    # the table was created. Building it is left to 'flask recompute-stats', which locks
+    # out the writers, never to a GET
+    return {
+        'stats': stats,
+        'recomputed_at': recomputed_at.strftime('%Y-%m-%dT%H:%M:%SZ') if recomputed_at else None,
+        'generated_at': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+    }
+
+def get_stats(entities, max_age=0):
+    # Serve this worker's last answer if it is younger than max_age seconds
+    key = tuple(entities)
+    max_age = min(max_age, STATS_CACHE_MAX_AGE)
+    cached = _cache.get(key)
+    if cached and time.monotonic() - cached[0] <= max_age:
+        return dict(cached[1], cached=True)
+
+    result = read_stats(entities)
+    _cache[key] = (time.monotonic(), result)
+    return dict(result, cached=False)
@@ -1,7 +1,10 @@
 import unittest
+from unittest import mock
 from app import app, db, Movie, Actor
+from models import Change, CatalogueStat
 from flask import jsonify
 from dotenv import load_dotenv
+import auth
 import os
 
 """Role Based Access Control Test Cases"""
@@ -37,6 +40,8 @@ class TestRoleBasedAccessControl(unittest.TestCase):
         self.app_context.push()
         db.session.query(Actor).delete()
         db.session.query(Movie).delete()
+        db.session.query(Change).delete()
+        db.session.query(CatalogueStat).delete()
         db.session.commit()
 
     def tearDown(self):
@@ -72,5 +77,22 @@ class TestRoleBasedAccessControl(unittest.TestCase):
         response = self.client.delete('/movies/1', headers=config_header(executive_producer_key))
         self.assertEqual(response.status_code, 200)
 
+    # Change feed and statistics: either read permission is enough
+    def test_actors_reader_can_view_changes_and_stats(self):
+        self.client.post('/movies', json={'title': 'Movie', 'release_date': '2023-01-01'}, headers=config_header(executive_producer_key))
+        self.client.post('/actors', json={'name': 'Actor', 'age': 30, 'gender': 'Male'}, headers=config_header(executive_producer_key))
+        with mock.patch.object(auth, 'verify_decode_jwt', return_value={'permissions': ['get:actors']}):
+            changes = self.client.get('/changes', headers=config_header('actors-reader'))
+            stats = self.client.get('/stats', headers=config_header('actors-reader'))
+        self.assertEqual(changes.status_code, 200)
+        self.assertEqual([change['entity'] for change in changes.json['changes']], ['actors'])
+        self.assertEqual(stats.status_code, 200)
+        self.assertNotIn('movies_by_year', stats.json['stats'])
+
+    def test_token_without_read_permissions_cannot_view_changes_or_stats(self):
+        with mock.patch.object(auth, 'verify_decode_jwt', return_value={'permissions': ['profile:requests']}):
+            self.assertEqual(self.client.get('/changes', headers=config_header('no-reader')).status_code, 403)
+            self.assertEqual(self.client.get('/stats', headers=config_header('no-reader')).status_code, 403)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
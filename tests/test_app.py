@@ -1,5 +1,12 @@
 import unittest
+import gzip
+import json
+import time
+from unittest import mock
 from app import app, db, Movie, Actor
+from models import Change, CatalogueStat
+import counts
+from changes import compact_changes
 from datetime import date
 from dotenv import load_dotenv
 import os
@@ -39,7 +46,10 @@ class TestApp(unittest.TestCase):
         self.app_context.push()
         db.session.query(Actor).delete()
         db.session.query(Movie).delete()
+        db.session.query(Change).delete()
+        db.session.query(CatalogueStat).delete()
         db.session.commit()
+        counts._cache.clear()
 
     def tearDown(self):
         self.app_context.pop()
@@ -54,6 +64,55 @@ class TestApp(unittest.TestCase):
         self.assertTrue(response.json['success'])
         self.assertEqual(len(response.json['movies']), 1)
 
+    def test_get_movies_filter_and_page(self):
+        for i in range(5):
+            db.session.add(Movie(title=f"Movie {i}", release_date=date(2020 + i, 1, 1)))
+        db.session.commit()
+        response = self.client.get('/movies?released_after=2021-01-01&page=2&per_page=2', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([movie['title'] for movie in response.json['movies']], ['Movie 3', 'Movie 4'])
+        self.assertEqual(response.json['page'], 2)
+
+    def test_get_movies_exact_count(self):
+        for i in range(5):
+            db.session.add(Movie(title=f"Movie {i}", release_date=date(2020 + i, 1, 1)))
+        db.session.commit()
+        response = self.client.get('/movies?released_after=2021-01-01&page=1&per_page=2&count=exact', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['movies']), 2)
+        self.assertEqual(response.json['total'], 4)
+        self.assertEqual(response.headers['X-Total-Count'], '4')
+
+        # Cached per filter signature for a short while
+        db.session.add(Movie(title="Movie 5", release_date=date(2025, 1, 1)))
+        db.session.commit()
+        response = self.client.get('/movies?released_after=2021-01-01&page=2&per_page=2&count=exact', headers=self.headers)
+        self.assertEqual(response.json['total'], 4)
+        response = self.client.get('/movies?count=exact', headers=self.headers)
+        self.assertEqual(response.json['total'], 6)
+
+    def test_get_movies_estimated_count_uses_stats(self):
+        # The maintained counter answers, not a COUNT(*) over the table
+        db.session.add(Movie(title="Test Movie", release_date=date(2023, 1, 1)))
+        db.session.add(CatalogueStat(dimension='totals', bucket='movies', count=42))
+        db.session.add(CatalogueStat(dimension='meta', bucket='recomputed', count=0))
+        db.session.commit()
+        response = self.client.get('/movies?count=estimated', headers=self.headers)
+        self.assertEqual(response.json['total'], 42)
+
+        # A filter no counter covers falls back to the exact count
+        response = self.client.get('/movies?title=test&count=estimated', headers=self.headers)
+        self.assertEqual(response.json['total'], 1)
+
+    def test_get_movies_without_count(self):
+        response = self.client.get('/movies', headers=self.headers)
+        self.assertNotIn('total', response.json)
+        self.assertNotIn('X-Total-Count', response.headers)
+
+    def test_get_movies_invalid_count(self):
+        response = self.client.get('/movies?count=all', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+
     # Tests for /movies/<int:movie_id> endpoint
     def test_get_movie_success(self):
         movie = Movie(title="Test Movie", release_date=date(2023, 1, 1))
@@ -128,6 +187,37 @@ class TestApp(unittest.TestCase):
         self.assertTrue(response.json['success'])
         self.assertEqual(len(response.json['actors']), 1)
 
+    def test_get_actors_filter(self):
+        db.session.add(Actor(name="Young Actor", age=20, gender="Male"))
+        db.session.add(Actor(name="Old Actor", age=60, gender="Male"))
+        db.session.add(Actor(name="Other Actor", age=60, gender="Female"))
+        db.session.commit()
+        response = self.client.get('/actors?gender=Male&min_age=30', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([actor['name'] for actor in response.json['actors']], ['Old Actor'])
+
+    def test_get_actors_gender_filter_is_case_insensitive(self):
+        db.session.add(Actor(name="Test Actor", age=30, gender="Male"))
+        db.session.commit()
+        response = self.client.get('/actors?gender=male&count=estimated', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([actor['name'] for actor in response.json['actors']], ['Test Actor'])
+        self.assertEqual(response.json['total'], 1)
+
+    def test_get_actors_invalid_gender_filter(self):
+        response = self.client.get('/actors?gender=robot', headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Invalid gender', response.json['message'])
+
+    def test_get_actors_estimated_count_by_gender(self):
+        # Created through the API so the gender counters are maintained
+        self.client.get('/stats', headers=self.headers)
+        for name, gender in (("Actor A", "Male"), ("Actor B", "Male"), ("Actor C", "Female")):
+            self.client.post('/actors', json={'name': name, 'age': 30, 'gender': gender}, headers=self.headers)
+        response = self.client.get('/actors?gender=Male&count=estimated', headers=self.headers)
+        self.assertEqual(response.json['total'], 2)
+        self.assertEqual(response.headers['X-Total-Count'], '2')
+
     # Tests for /actors/<int:actor_id> endpoint
     def test_get_actor_success(self):
         actor = Actor(name="Test Actor", age=30, gender="Male")
@@ -158,6 +248,18 @@ class TestApp(unittest.TestCase):
         self.assertFalse(response.json['success'])
         self.assertIn('Missing required fields', response.json['message'])
 
+    def test_create_actor_invalid_gender(self):
+        response = self.client.post('/actors', json={'name': 'New Actor', 'age': 30, 'gender': 'Unknown'}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json['success'])
+        self.assertIn('Invalid gender', response.json['message'])
+
+    def test_create_actor_invalid_age(self):
+        response = self.client.post('/actors', json={'name': 'New Actor', 'age': 200, 'gender': 'Male'}, headers=self.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json['success'])
+        self.assertIn('Invalid age', response.json['message'])
+
     # Tests for /actors/<int:actor_id> PUT endpoint
     def test_update_actor_success(self):
         actor = Actor(name="Old Name", age=30, gender="Male")
@@ -192,5 +294,150 @@ class TestApp(unittest.TestCase):
         self.assertFalse(response.json['success'])
         self.assertIn('Actor not found with the provided ID.', response.json['message'])
 
+    # Tests for /changes endpoint
+    def test_get_changes_success(self):
+        self.client.post('/movies', json={'title': 'New Movie', 'release_date': '2023-01-01'}, headers=self.headers)
+        self.client.post('/actors', json={'name': 'New Actor', 'age': 30, 'gender': 'Male'}, headers=self.headers)
+        response = self.client.get('/changes?since=0', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['success'])
+        self.assertEqual([c['entity'] for c in response.json['changes']], ['movies', 'actors'])
+        self.assertEqual(response.json['last_seq'], response.json['changes'][-1]['seq'])
+
+    def test_get_changes_only_returns_newer(self):
+        self.client.post('/movies', json={'title': 'New Movie', 'release_date': '2023-01-01'}, headers=self.headers)
+        last_seq = self.client.get('/changes', headers=self.headers).json['last_seq']
+        movie_id = db.session.query(Movie).first().id
+        self.client.delete(f'/movies/{movie_id}', headers=self.headers)
+        response = self.client.get(f'/changes?since={last_seq}', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['changes']), 1)
+        self.assertEqual(response.json['changes'][0]['op'], 'delete')
+        self.assertEqual(response.json['changes'][0]['entity_id'], movie_id)
+
+    def test_get_changes_long_poll_times_out_empty(self):
+        self.client.post('/movies', json={'title': 'New Movie', 'release_date': '2023-01-01'}, headers=self.headers)
+        last_seq = self.client.get('/changes', headers=self.headers).json['last_seq']
+        started = time.monotonic()
+        with mock.patch('changes.CHANGES_POLL_INTERVAL', 0.05):
+            response = self.client.get(f'/changes?since={last_seq}&wait=0.3', headers=self.headers)
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['changes'], [])
+        self.assertEqual(response.json['last_seq'], last_seq)
+
+    def test_get_changes_long_poll_returns_pending_changes_at_once(self):
+        self.client.post('/movies', json={'title': 'New Movie', 'release_date': '2023-01-01'}, headers=self.headers)
+        started = time.monotonic()
+        response = self.client.get('/changes?since=0&wait=5', headers=self.headers)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual([c['entity'] for c in response.json['changes']], ['movies'])
+
+    def test_get_changes_event_stream(self):
+        self.client.post('/movies', json={'title': 'New Movie', 'release_date': '2023-01-01'}, headers=self.headers)
+        self.client.post('/actors', json={'name': 'New Actor', 'age': 30, 'gender': 'Male'}, headers=self.headers)
+        seqs = [c['seq'] for c in self.client.get('/changes', headers=self.headers).json['changes']]
+        with mock.patch('changes.CHANGES_SSE_MAX_DURATION', 0.2), mock.patch('changes.CHANGES_POLL_INTERVAL', 0.05):
+            response = self.client.get('/changes', headers=dict(self.headers, Accept='text/event-stream'))
+            body = response.get_data(as_text=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        self.assertTrue(body.startswith('retry: '))
+        events = [event for event in body.split('\n\n') if event.startswith('id: ')]
+        self.assertEqual([int(event.split('\n')[0][4:]) for event in events], seqs)
+        self.assertEqual(json.loads(events[1].split('\ndata: ')[1])['entity'], 'actors')
+
+    def test_get_changes_event_stream_resumes_from_last_event_id(self):
+        self.client.post('/movies', json={'title': 'New Movie', 'release_date': '2023-01-01'}, headers=self.headers)
+        self.client.post('/actors', json={'name': 'New Actor', 'age': 30, 'gender': 'Male'}, headers=self.headers)
+        first, second = [c['seq'] for c in self.client.get('/changes', headers=self.headers).json['changes']]
+        headers = dict(self.headers, **{'Accept': 'text/event-stream', 'Last-Event-ID': str(first)})
+        with mock.patch('changes.CHANGES_SSE_MAX_DURATION', 0.2), mock.patch('changes.CHANGES_POLL_INTERVAL', 0.05):
+            body = self.client.get('/changes?since=0', headers=headers).get_data(as_text=True)
+        self.assertNotIn(f'id: {first}\n', body)
+        self.assertIn(f'id: {second}\n', body)
+
+    def test_get_changes_after_compaction(self):
+        for i in range(3):
+            self.client.post('/movies', json={'title': f'Movie {i}', 'release_date': '2023-01-01'}, headers=self.headers)
+        compact_changes(max_rows=2)
+
+        # A cursor from before the compaction is gone; the 410 carries where to resume
+        response = self.client.get('/changes', headers=self.headers)
+        self.assertEqual(response.status_code, 410)
+        self.assertFalse(response.json['success'])
+        last_seq = db.session.query(db.func.max(Change.seq)).scalar()
+        self.assertEqual(response.json['last_seq'], last_seq)
+        self.assertLess(response.json['compacted_through'], last_seq)
+
+        # A new consumer takes the current cursor and follows on from it
+        response = self.client.get('/changes?since=latest', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['changes'], [])
+        self.assertEqual(response.json['last_seq'], last_seq)
+        self.client.post('/movies', json={'title': 'Movie 3', 'release_date': '2023-01-01'}, headers=self.headers)
+        response = self.client.get(f'/changes?since={last_seq}', headers=self.headers)
+        self.assertEqual([c['op'] for c in response.json['changes']], ['create'])
+
+    # Tests for /stats endpoint
+    def test_get_stats_success(self):
+        self.client.post('/movies', json={'title': 'New Movie', 'release_date': '2023-01-01'}, headers=self.headers)
+        self.client.post('/actors', json={'name': 'New Actor', 'age': 30, 'gender': 'Male'}, headers=self.headers)
+        response = self.client.get('/stats', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['success'])
+        self.assertEqual(response.json['stats']['movies_by_year'], {'2023': 1})
+        self.assertEqual(response.json['stats']['actors_by_gender'], {'Male': 1})
+        self.assertEqual(response.json['stats']['actors_by_age'], {'25-34': 1})
+
+    def test_get_stats_does_not_recompute(self):
+        db.session.add(Movie(title='Outside The API', release_date=date(2023, 1, 1)))
+        db.session.commit()
+        with mock.patch('stats.recompute_stats') as recompute:
+            response = self.client.get('/stats', headers=self.headers)
+        recompute.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json['recomputed_at'])
+        self.assertEqual(response.json['stats'], {})
+
+    def test_get_stats_tracks_updates_and_deletes(self):
+        self.client.get('/stats', headers=self.headers)
+        self.client.post('/actors', json={'name': 'New Actor', 'age': 30, 'gender': 'Male'}, headers=self.headers)
+        actor_id = db.session.query(Actor).first().id
+        self.client.patch(f'/actors/{actor_id}', json={'age': 40}, headers=self.headers)
+        self.client.post('/movies', json={'title': 'New Movie', 'release_date': '2023-01-01'}, headers=self.headers)
+        movie_id = db.session.query(Movie).first().id
+        self.client.delete(f'/movies/{movie_id}', headers=self.headers)
+        response = self.client.get('/stats', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['stats']['actors_by_age'], {'35-44': 1})
+        self.assertEqual(response.json['stats']['totals'], {'actors': 1})
+        self.assertNotIn('movies_by_year', response.json['stats'])
+
+    # Tests for response compression
+    def test_error_responses_are_not_compressed(self):
+        with mock.patch('compression.COMPRESS_MIN_SIZE', 0):
+            response = self.client.get('/movies?released_after=bad', headers=dict(self.headers, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response.status_code, 400)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_get_movies_gzip(self):
+        for i in range(50):
+            db.session.add(Movie(title=f"Test Movie {i}", release_date=date(2023, 1, 1)))
+        db.session.commit()
+        response = self.client.get('/movies', headers=dict(self.headers, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(response.data))['movies']), 50)
+
+    def test_get_movie_small_body_not_compressed(self):
+        movie = Movie(title="Test Movie", release_date=date(2023, 1, 1))
+        db.session.add(movie)
+        db.session.commit()
+        response = self.client.get(f'/movies/{movie.id}', headers=dict(self.headers, **{'Accept-Encoding': 'gzip'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,224 @@
+import unittest
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import mock
+from werkzeug.exceptions import ServiceUnavailable
+from app import app, db
+import auth
+import models
+from breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+from dotenv import load_dotenv
+import os
+
+"""Test cases for the circuit breakers and the JWKS fetch timeouts."""
+
+# Access environments variables
+jwt = os.getenv("EXECUTIVE_PRODUCER_KEY")
+
+# Load environment variables from .env file
+load_dotenv()
+
+KEYS = {'keys': [{'kid': 'key-1', 'kty': 'RSA', 'use': 'sig', 'n': 'n', 'e': 'AQAB'}]}
+
+## Stub Auth0 whose response time the tests control
+class StubJWKSHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    requests = 0
+
+    def do_GET(self):
+        StubJWKSHandler.requests += 1
+        time.sleep(StubJWKSHandler.delay)
+        body = json.dumps(KEYS).encode()
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.1)
+
+    def fail(self):
+        raise OSError('down')
+
+    def test_opens_after_threshold_and_fails_fast(self):
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        called = []
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(called.append, 1)
+        self.assertEqual(called, [])
+
+    def test_half_open_lets_one_probe_through(self):
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                self.breaker.call(self.fail)
+        time.sleep(0.15)
+
+        # The first caller probes; a concurrent caller still fails fast
+        self.breaker.before_call()
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+
+    def test_failed_probe_reopens(self):
+        for _ in range(2):
+            with self.assertRaises(OSError):
+                self.breaker.call(self.fail)
+        time.sleep(0.15)
+        with self.assertRaises(OSError):
+            self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_success_resets_the_failure_count(self):
+        with self.assertRaises(OSError):
+            self.breaker.call(self.fail)
+        self.breaker.call(lambda: None)
+        with self.assertRaises(OSError):
+            self.breaker.call(self.fail)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+class TestJWKSFetch(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubJWKSHandler)
+        cls.server.daemon_threads = True
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubJWKSHandler.delay = 0.0
+        StubJWKSHandler.requests = 0
+        self.breaker = CircuitBreaker('test-jwks', failure_threshold=2, reset_timeout=0.3)
+        self.patches = [
+            mock.patch.object(auth, 'JWKS_URL', f'http://127.0.0.1:{self.server.server_port}/.well-known/jwks.json'),
+            mock.patch.object(auth, 'JWKS_READ_TIMEOUT', 0.2),
+            mock.patch.object(auth, 'jwks_breaker', self.breaker),
+            mock.patch.dict(auth._jwks, {'keys': None, 'fetched_at': 0.0})
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+
+    def expire_cache(self):
+        auth._jwks['fetched_at'] = time.monotonic() - auth.JWKS_CACHE_TTL - 1
+
+    def test_fetches_and_caches_keys(self):
+        self.assertEqual(auth.get_jwks(), KEYS)
+        self.assertEqual(auth.get_jwks(), KEYS)
+        self.assertEqual(StubJWKSHandler.requests, 1)
+
+    def test_slow_server_times_out_without_keys(self):
+        StubJWKSHandler.delay = 1.0
+        started = time.monotonic()
+        with self.assertRaises(ServiceUnavailable):
+            auth.get_jwks()
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_serves_last_known_keys_and_opens(self):
+        auth.get_jwks()
+        StubJWKSHandler.delay = 1.0
+
+        # Each slow fetch gives up after the read timeout and keeps the old keys
+        for _ in range(2):
+            self.expire_cache()
+            started = time.monotonic()
+            self.assertEqual(auth.get_jwks(), KEYS)
+            self.assertLess(time.monotonic() - started, 0.9)
+        self.assertEqual(self.breaker.state, OPEN)
+
+        # Open: no request reaches the server at all
+        requests = StubJWKSHandler.requests
+        self.expire_cache()
+        started = time.monotonic()
+        self.assertEqual(auth.get_jwks(), KEYS)
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertEqual(StubJWKSHandler.requests, requests)
+
+        # Half-open probe against a recovered server closes it again
+        StubJWKSHandler.delay = 0.0
+        time.sleep(0.35)
+        self.expire_cache()
+        self.assertEqual(auth.get_jwks(), KEYS)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(StubJWKSHandler.requests, requests + 1)
+
+
+class TestDatabaseBreaker(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        cls.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+        cls.headers = {'Authorization': f'Bearer {jwt}'}
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.drop_all()
+
+    def tearDown(self):
+        models.db_breaker.record_success()
+
+    def test_open_database_breaker_returns_503(self):
+        for _ in range(models.db_breaker.failure_threshold):
+            models.db_breaker.record_failure(OSError('connection refused'))
+
+        response = self.client.get('/movies', headers=self.headers)
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json['success'])
+
+        # Unauthenticated readiness shows the state but not the error message
+        response = self.client.get('/ready')
+        self.assertEqual(response.json['breakers']['database']['state'], OPEN)
+        self.assertNotIn('last_error', response.json['breakers']['database'])
+
+        with mock.patch.object(auth, 'verify_decode_jwt', return_value={'permissions': ['profile:requests']}):
+            response = self.client.get('/breakers', headers=self.headers)
+        self.assertEqual(response.json['breakers']['database']['state'], OPEN)
+        self.assertEqual(response.json['breakers']['database']['last_error'], 'connection refused')
+
+    def test_closed_database_breaker_serves_requests(self):
+        response = self.client.get('/movies', headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/ready').json['breakers']['database']['state'], CLOSED)
+
+    def test_breakers_require_authentication(self):
+        self.assertEqual(self.client.get('/breakers').status_code, 401)
+        with mock.patch.object(auth, 'verify_decode_jwt', return_value={'permissions': ['get:movies']}):
+            self.assertEqual(self.client.get('/breakers', headers=self.headers).status_code, 403)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import unittest
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from datetime import date
+from unittest import mock
+from sqlalchemy import event
+from werkzeug.exceptions import ServiceUnavailable
+from app import app, db, Movie, Actor
+from models import Change, CatalogueStat
+from groupcommit import GroupCommitter
+
+"""Test cases for the group-commit write pipeline."""
+
+class TestGroupCommit(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # A file database: the writer thread needs its own connection
+        handle, cls.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{cls.path}'
+        with app.app_context():
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+        os.remove(cls.path)
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.session.query(Actor).delete()
+        db.session.query(Movie).delete()
+        db.session.query(Change).delete()
+        db.session.query(CatalogueStat).delete()
+        db.session.commit()
+        self.committer = GroupCommitter(window=0.2, max_ops=64)
+
+    def tearDown(self):
+        db.session.remove()
+        self.app_context.pop()
+
+    def create_movie(self, title):
+        def create():
+            movie = Movie(title=title, release_date=date(2023, 1, 1))
+            db.session.add(movie)
+            db.session.flush()
+            return movie.format()
+        return create
+
+    def submit_concurrently(self, ops):
+        results = [None] * len(ops)
+
+        def submit(index, op):
+            try:
+                results[index] = self.committer.submit(op)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=submit, args=(i, op)) for i, op in enumerate(ops)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def test_concurrent_writes_share_a_commit(self):
+        commits = []
+        listener = lambda connection: commits.append(1)
+        event.listen(db.engine, 'commit', listener)
+        try:
+            results = self.submit_concurrently([self.create_movie(f"Movie {i}") for i in range(10)])
+        finally:
+            event.remove(db.engine, 'commit', listener)
+
+        self.assertEqual(sorted(result['title'] for result in results), sorted(f"Movie {i}" for i in range(10)))
+        self.assertEqual(len({result['id'] for result in results}), 10)
+        self.assertLess(len(commits), 10)
+        self.assertEqual(Movie.query.count(), 10)
+
+    def test_failing_op_does_not_poison_the_batch(self):
+        def fail():
+            db.session.add(Movie(title="Half Written", release_date=date(2023, 1, 1)))
+            db.session.flush()
+            raise ValueError('Invalid input!')
+
+        results = self.submit_concurrently([self.create_movie("First"), fail, self.create_movie("Second")])
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(sorted(movie.title for movie in Movie.query.all()), ['First', 'Second'])
+
+    def test_batch_is_one_transaction(self):
+        def count_from_other_connection():
+            with db.engine.connect() as connection:
+                return connection.exec_driver_sql('SELECT COUNT(*) FROM movies').scalar()
+
+        first, second = Future(), Future()
+        self.committer.commit([(self.create_movie("First"), first), (count_from_other_connection, second)])
+        self.assertEqual(second.result(), 0)
+        self.assertEqual(Movie.query.count(), 1)
+
+    def test_writer_survives_an_unexpected_error(self):
+        commit = self.committer.commit
+        calls = []
+
+        def commit_once_broken(batch):
+            calls.append(batch)
+            if len(calls) == 1:
+                raise RuntimeError('broken')
+            commit(batch)
+
+        with mock.patch.object(self.committer, 'commit', commit_once_broken):
+            with self.assertRaises(RuntimeError):
+                self.committer.submit(self.create_movie("Lost"))
+            self.assertEqual(self.committer.submit(self.create_movie("Kept"))['title'], "Kept")
+        self.assertEqual([movie.title for movie in Movie.query.all()], ['Kept'])
+
+    def test_slow_writer_times_out_with_503(self):
+        running, release = threading.Event(), threading.Event()
+
+        def block():
+            running.set()
+            release.wait(5)
+
+        blocker = threading.Thread(target=self.submit_concurrently, args=([block],))
+        blocker.start()
+        try:
+            running.wait(5)
+            self.committer.timeout = 0.2
+            # Queued behind the blocked op: dropped once its caller gives up
+            with self.assertRaises(ServiceUnavailable):
+                self.committer.submit(self.create_movie("Too Late"))
+        finally:
+            release.set()
+            blocker.join(5)
+        self.committer.timeout = 5
+        self.committer.submit(lambda: None)
+        self.assertEqual(Movie.query.count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+import csv
+import io
+import os
+import sqlite3
+import tempfile
+from datetime import date
+from app import app, db, Movie, Actor
+from models import Change, CatalogueStat
+from importer import CopyStream, merge_statements
+
+"""Test cases for the 'flask import-catalogue' command."""
+
+class TestImportCatalogue(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        cls.runner = app.test_cli_runner()
+        with app.app_context():
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.drop_all()
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.session.query(Actor).delete()
+        db.session.query(Movie).delete()
+        db.session.query(Change).delete()
+        db.session.query(CatalogueStat).delete()
+        db.session.commit()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    def write_file(self, suffix, content):
+        handle, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(handle, 'w') as file:
+            file.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_movies_csv(self):
+        path = self.write_file('.csv', 'title,release_date\nFirst Movie,2023-01-01\nBad Date,01/02/2023\nSecond Movie,2024-02-29\n')
+        result = self.runner.invoke(args=['import-catalogue', path, '--entity', 'movies'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Imported 2 movies', result.output)
+        self.assertIn('1 rejected', result.output)
+        self.assertEqual(sorted(movie.title for movie in Movie.query.all()), ['First Movie', 'Second Movie'])
+        self.assertEqual(Change.query.filter_by(entity='movies', op='import').count(), 1)
+
+    def test_import_actors_ndjson_merges_by_id(self):
+        db.session.add(Actor(id=7, name="Old Name", age=30, gender="Male"))
+        db.session.commit()
+        path = self.write_file('.ndjson', '{"id": 7, "name": "New Name", "age": 31, "gender": "Male"}\n'
+                                          '{"name": "Other Actor", "age": 40, "gender": "Female"}\n')
+        result = self.runner.invoke(args=['import-catalogue', path, '--entity', 'actors'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        db.session.expire_all()
+        self.assertEqual(Actor.query.get(7).name, "New Name")
+        self.assertEqual(Actor.query.count(), 2)
+        self.assertEqual(
+            CatalogueStat.query.filter_by(dimension='totals', bucket='actors').one().count, 2
+        )
+
+    def test_import_strict_stops_on_invalid_row(self):
+        path = self.write_file('.csv', 'title,release_date\nFirst Movie,2023-01-01\nBad Date,2023-13-01\n')
+        result = self.runner.invoke(args=['import-catalogue', path, '--entity', 'movies', '--strict'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('Line 3', result.output)
+        self.assertEqual(Movie.query.count(), 0)
+
+    def test_ndjson_line_numbers_count_blank_lines(self):
+        path = self.write_file('.ndjson', '{"title": "First Movie", "release_date": "2023-01-01"}\n'
+                                          '\n'
+                                          '{"title": "Bad Date", "release_date": "2023-13-01"}\n')
+        result = self.runner.invoke(args=['import-catalogue', path, '--entity', 'movies'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Line 3: skipped', result.output)
+
+    def test_actor_ages_follow_the_api_rules(self):
+        path = self.write_file('.ndjson', '{"name": "Whole", "age": 30, "gender": "Male"}\n'
+                                          '{"name": "Fraction", "age": 12.7, "gender": "Male"}\n'
+                                          '{"name": "Boolean", "age": true, "gender": "Male"}\n'
+                                          '{"name": "Text", "age": "41", "gender": "Female"}\n'
+                                          '{"name": "Too Old", "age": 151, "gender": "Other"}\n')
+        result = self.runner.invoke(args=['import-catalogue', path, '--entity', 'actors'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('3 rejected', result.output)
+        self.assertEqual(sorted((actor.name, actor.age) for actor in Actor.query.all()), [('Text', 41), ('Whole', 30)])
+
+    def test_malformed_ndjson_line_is_skipped(self):
+        path = self.write_file('.ndjson', '{"title": "First Movie", "release_date": "2023-01-01"}\n'
+                                          '{"title": "Broken", \n'
+                                          '{"title": "Second Movie", "release_date": "2023-01-02"}\n')
+        result = self.runner.invoke(args=['import-catalogue', path, '--entity', 'movies'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('Line 2: skipped', result.output)
+        self.assertEqual(sorted(movie.title for movie in Movie.query.all()), ['First Movie', 'Second Movie'])
+
+        result = self.runner.invoke(args=['import-catalogue', path, '--entity', 'movies', '--strict'])
+        self.assertNotEqual(result.exit_code, 0)
+        self.assertIn('Line 2', result.output)
+
+    def test_repeated_id_keeps_last_row(self):
+        path = self.write_file('.csv', 'id,title,release_date\n5,First,2023-01-01\n5,Second,2023-01-02\n')
+        result = self.runner.invoke(args=['import-catalogue', path, '--entity', 'movies'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual([movie.title for movie in Movie.query.all()], ['Second'])
+
+
+class TestCopyPath(unittest.TestCase):
+
+    def test_copy_stream_serves_csv_in_chunks(self):
+        rows = [
+            {'id': None, 'title': 'Plain', 'release_date': date(2023, 1, 1)},
+            {'id': 3, 'title': 'Comma, "quoted"', 'release_date': date(2024, 2, 29)},
+        ]
+        stream = CopyStream(iter(rows), ['id', 'title', 'release_date'])
+        chunks = []
+        while True:
+            chunk = stream.read(7)
+            if not chunk:
+                break
+            self.assertLessEqual(len(chunk), 7)
+            chunks.append(chunk)
+        parsed = list(csv.reader(io.StringIO(b''.join(chunks).decode())))
+        self.assertEqual(parsed, [['', 'Plain', '2023-01-01'], ['3', 'Comma, "quoted"', '2024-02-29']])
+
+    def test_merge_order(self):
+        upsert, setval, insert = merge_statements('movies', ['id', 'title', 'release_date'], 'public.movies_id_seq')
+
+        # Repeated ids collapse to the file's last row before the upsert
+        self.assertIn('DISTINCT ON (id)', upsert)
+        self.assertIn('ORDER BY id, import_line DESC', upsert)
+        self.assertIn('WHERE id IS NOT NULL', upsert)
+
+        # The sequence moves past the explicit ids before id-less rows draw from it, but never
+        # backwards (newest rows deleted) and not at all on an empty table (MAX(id) is NULL)
+        self.assertIn("setval('public.movies_id_seq', ids.max_id)", setval)
+        self.assertIn('WHERE ids.max_id >= seq.last_value + CASE WHEN seq.is_called THEN 1 ELSE 0 END', setval)
+        self.assertNotIn('GREATEST', setval)
+
+        # The others get a new id, in file order
+        self.assertIn('WHERE id IS NULL', insert)
+        self.assertTrue(insert.startswith('INSERT INTO movies (title, release_date) '))
+
+    def test_sequence_only_moves_forward(self):
+        setval = merge_statements('movies', ['id', 'title', 'release_date'], 'movies_id_seq')[1]
+
+        # The statement run against a stand-in for the Postgres sequence relation
+        def next_id(ids, last_value, is_called):
+            connection = sqlite3.connect(':memory:')
+            connection.execute('CREATE TABLE movies (id INTEGER)')
+            connection.execute('CREATE TABLE movies_id_seq (last_value INTEGER, is_called BOOLEAN)')
+            connection.executemany('INSERT INTO movies VALUES (?)', [(id,) for id in ids])
+            connection.execute('INSERT INTO movies_id_seq VALUES (?, ?)', (last_value, is_called))
+            moved = []
+            connection.create_function('setval', 2, lambda sequence, value: moved.append(value) or value)
+            connection.execute(setval).fetchall()
+            connection.close()
+            return moved[0] + 1 if moved else last_value + (1 if is_called else 0)
+
+        self.assertEqual(next_id([], 1, False), 1)              # empty table: ids still start at 1
+        self.assertEqual(next_id([5, 9], 3, True), 10)          # explicit ids ahead of the sequence
+        self.assertEqual(next_id([1, 2], 7, True), 8)           # newest rows deleted: never backwards
+        self.assertEqual(next_id([1], 1, False), 2)             # fresh sequence, id 1 taken explicitly
+
+
+if __name__ == '__main__':
+    unittest.main()
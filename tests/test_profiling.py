@@ -0,0 +1,124 @@
+import unittest
+import itertools
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import date
+from app import app, db, Movie
+import profiling
+from profiling import StackSampler, to_speedscope
+from dotenv import load_dotenv
+import os
+
+"""Test cases for on-demand request profiling."""
+
+# Access environments variables (the Executive Producer token also holds profile:requests)
+executive_producer_jwt = os.getenv("EXECUTIVE_PRODUCER_KEY")
+casting_assistant_jwt = os.getenv("CASTING_ASSISTANT_KEY")
+
+# Load environment variables from .env file
+load_dotenv()
+
+class TestProfiling(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        cls.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.add(Movie(title="Test Movie", release_date=date(2023, 1, 1)))
+            db.session.commit()
+
+        cls.producer = {'Authorization': f'Bearer {executive_producer_jwt}'}
+        cls.assistant = {'Authorization': f'Bearer {casting_assistant_jwt}'}
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.drop_all()
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.patch = mock.patch.object(profiling, 'PROFILE_DIR', self.profile_dir)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        shutil.rmtree(self.profile_dir)
+
+    def test_unprofiled_request_has_no_profile(self):
+        response = self.client.get('/movies', headers=self.producer)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_profile_requires_permission(self):
+        response = self.client.get('/movies', headers=dict(self.assistant, **{'X-Profile': '1'}))
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_sampled_profile_is_stored(self):
+        response = self.client.get('/movies', headers=dict(self.producer, **{'X-Profile': '1'}))
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers['X-Profile-Id']
+
+        response = self.client.get(f'/profiles/{profile_id}', headers=self.producer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+
+        response = self.client.get(f'/profiles/{profile_id}?format=speedscope', headers=self.producer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['profiles'][0]['type'], 'sampled')
+
+    def test_cprofile_report(self):
+        response = self.client.get('/movies', headers=dict(self.producer, **{'X-Profile': 'cprofile'}))
+        profile_id = response.headers['X-Profile-Id']
+        response = self.client.get(f'/profiles/{profile_id}', headers=self.producer)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'get_movies', response.data)
+
+    def test_reading_profiles_requires_permission(self):
+        response = self.client.get('/profiles/' + '0' * 32, headers=self.assistant)
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get('/profiles/' + '0' * 32, headers=self.producer)
+        self.assertEqual(response.status_code, 404)
+
+    def test_one_in_n_route_sampling(self):
+        with mock.patch.dict(profiling.PROFILE_SAMPLE_RATES, {'get_movies': 2}), \
+                mock.patch.dict(profiling._sample_counters, {'get_movies': itertools.count(1)}):
+            profiled = [
+                'X-Profile-Id' in self.client.get('/movies', headers=self.assistant).headers
+                for _ in range(4)
+            ]
+        self.assertEqual(profiled, [False, True, False, True])
+
+
+class TestStackSampler(unittest.TestCase):
+
+    def test_collapsed_stacks_and_speedscope(self):
+        def busy_loop(deadline):
+            while time.monotonic() < deadline:
+                pass
+
+        sampler = StackSampler(threading.get_ident(), interval=0.001)
+        sampler.start()
+        busy_loop(time.monotonic() + 0.05)
+        sampler.stop()
+
+        collapsed = sampler.collapsed()
+        self.assertIn('busy_loop (test_profiling.py:', collapsed)
+        speedscope = to_speedscope(collapsed, 'test', 0.001)
+        self.assertEqual(len(speedscope['profiles'][0]['samples']), len(collapsed.splitlines()))
+        self.assertAlmostEqual(
+            speedscope['profiles'][0]['endValue'],
+            sum(sampler.stacks.values()) * 0.001
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,175 @@
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date
+from unittest import mock
+from sqlalchemy import event
+from app import app, db, Movie
+import auth
+import profiling
+from singleflight import SingleFlight
+
+"""Test cases for the single-flight request coalescing group and the @coalesce decorator."""
+
+# Permissions behind each stub token
+PERMISSIONS = {
+    'reader': ['get:movies'],
+    'other-reader': ['get:movies', 'get:actors'],
+    'profiler': ['get:movies', 'profile:requests'],
+}
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        self.group = SingleFlight()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def slow_fetch(self, value):
+        def fetch():
+            self.calls += 1
+            self.release.wait(5)
+            return value
+        return fetch
+
+    def run_concurrently(self, jobs):
+        results = [None] * len(jobs)
+
+        def run(index, key, fn):
+            try:
+                results[index] = self.group.do(key, fn)
+            except Exception as e:
+                results[index] = e
+
+        threads = [threading.Thread(target=run, args=(i, key, fn)) for i, (key, fn) in enumerate(jobs)]
+        for thread in threads:
+            thread.start()
+
+        # Give every caller time to join a flight before letting the leaders finish
+        time.sleep(0.1)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_identical_calls_share_one_execution(self):
+        results = self.run_concurrently([('movie:1', self.slow_fetch('result'))] * 10)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, ['result'] * 10)
+
+    def test_different_keys_are_not_merged(self):
+        results = self.run_concurrently([
+            (('movie:1', 'scope-a'), self.slow_fetch('a')),
+            (('movie:1', 'scope-b'), self.slow_fetch('b')),
+        ])
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(results, ['a', 'b'])
+
+    def test_error_is_propagated_to_every_caller(self):
+        def failing_fetch():
+            self.calls += 1
+            self.release.wait(5)
+            raise LookupError('Movie not found with the provided ID.')
+
+        results = self.run_concurrently([('movie:1', failing_fetch)] * 5)
+        self.assertEqual(self.calls, 1)
+        for result in results:
+            self.assertIsInstance(result, LookupError)
+
+    def test_key_is_released_after_completion(self):
+        self.release.set()
+        self.assertEqual(self.group.do('movie:1', lambda: 1), 1)
+        self.assertEqual(self.group.do('movie:1', lambda: 2), 2)
+        self.assertEqual(self.group.calls, {})
+
+
+class TestCoalesceView(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # A file database: the concurrent requests each need their own connection
+        handle, cls.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(handle)
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{cls.path}'
+        cls.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            movie = Movie(title="Test Movie", release_date=date(2023, 1, 1))
+            db.session.add(movie)
+            db.session.commit()
+            cls.movie_id = movie.id
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.drop_all()
+            db.engine.dispose()
+        os.remove(cls.path)
+
+    def setUp(self):
+        self.profile_dir = tempfile.mkdtemp()
+        self.lookups = 0
+        self.patches = [
+            mock.patch.object(auth, 'verify_decode_jwt', side_effect=lambda token: {'permissions': PERMISSIONS[token]}),
+            mock.patch.object(profiling, 'PROFILE_DIR', self.profile_dir)
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        # Every handler run looks the movie up once; slow it down so the requests overlap
+        self.app_context = app.app_context()
+        self.app_context.push()
+        self.engine = db.engine
+        event.listen(self.engine, 'before_cursor_execute', self.slow_movie_lookup)
+
+    def tearDown(self):
+        event.remove(self.engine, 'before_cursor_execute', self.slow_movie_lookup)
+        self.app_context.pop()
+        for patch in reversed(self.patches):
+            patch.stop()
+        shutil.rmtree(self.profile_dir)
+
+    def slow_movie_lookup(self, connection, cursor, statement, parameters, context, executemany):
+        if 'FROM movies' in statement:
+            self.lookups += 1
+            time.sleep(0.2)
+
+    def get_concurrently(self, headers_list):
+        responses = [None] * len(headers_list)
+
+        def get(index, headers):
+            responses[index] = app.test_client().get(f'/movies/{self.movie_id}', headers=headers)
+
+        threads = [threading.Thread(target=get, args=(i, headers)) for i, headers in enumerate(headers_list)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return responses
+
+    def headers(self, token, **extra):
+        return dict({'Authorization': f'Bearer {token}'}, **extra)
+
+    def test_same_permissions_share_one_handler_run(self):
+        responses = self.get_concurrently([self.headers('reader')] * 5)
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+        self.assertEqual({response.json['movie']['title'] for response in responses}, {"Test Movie"})
+        self.assertEqual(self.lookups, 1)
+
+    def test_different_permissions_are_never_merged(self):
+        responses = self.get_concurrently([self.headers('reader'), self.headers('other-reader')])
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(self.lookups, 2)
+
+    def test_profiled_requests_are_not_coalesced(self):
+        responses = self.get_concurrently([self.headers('profiler', **{'X-Profile': '1'})] * 2)
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertTrue(all('X-Profile-Id' in response.headers for response in responses))
+        self.assertEqual(self.lookups, 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from datetime import date
+from app import app, db, Movie, Actor
+from models import Change, CatalogueStat
+from changes import record_change, compact_changes
+from snapshot import CatalogueSnapshot
+
+"""Test cases for the in-memory columnar catalogue snapshot."""
+
+class TestCatalogueSnapshot(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        with app.app_context():
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.drop_all()
+
+    def setUp(self):
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.session.query(Actor).delete()
+        db.session.query(Movie).delete()
+        db.session.query(Change).delete()
+        db.session.query(CatalogueStat).delete()
+        db.session.commit()
+        self.snapshot = CatalogueSnapshot()
+
+    def tearDown(self):
+        self.app_context.pop()
+
+    # Write the same way the handlers do: row and outbox entry in one commit
+    def add_movie(self, title, release_date):
+        movie = Movie(title=title, release_date=release_date)
+        db.session.add(movie)
+        db.session.flush()
+        record_change('movies', 'create', movie.id, movie.format())
+        db.session.commit()
+        return movie.id
+
+    def test_load_matches_database(self):
+        for i in range(5):
+            db.session.add(Movie(title=f"Movie {i}", release_date=date(2020 + i, 1, 1)))
+            db.session.add(Actor(name=f"Actor {i}", age=20 + i * 10, gender="Female" if i % 2 else "Male"))
+        db.session.commit()
+        self.snapshot.refresh(force=True)
+        self.assertEqual(
+            self.snapshot.query_movies({}),
+            [movie.format() for movie in Movie.query.order_by(Movie.id)]
+        )
+        self.assertEqual(
+            self.snapshot.query_actors({}),
+            [actor.format() for actor in Actor.query.order_by(Actor.id)]
+        )
+
+    def test_filters_and_pagination(self):
+        for i in range(5):
+            db.session.add(Movie(title=f"Movie {i}", release_date=date(2020 + i, 1, 1)))
+            db.session.add(Actor(name=f"Actor {i}", age=20 + i * 10, gender="Female" if i % 2 else "Male"))
+        db.session.commit()
+        self.snapshot.refresh(force=True)
+        movies = self.snapshot.query_movies({'released_after': date(2021, 1, 1), 'released_before': date(2023, 1, 1)}, 1, 1)
+        self.assertEqual([movie['title'] for movie in movies], ['Movie 2'])
+        self.assertEqual(len(self.snapshot.query_movies({'title': 'movie 4'})), 1)
+        actors = self.snapshot.query_actors({'gender': 'Male', 'min_age': 30})
+        self.assertEqual([actor['name'] for actor in actors], ['Actor 2', 'Actor 4'])
+
+    def test_counts(self):
+        for i in range(5):
+            db.session.add(Movie(title=f"Movie {i}", release_date=date(2020 + i, 1, 1)))
+            db.session.add(Actor(name=f"Actor {i}", age=20 + i * 10, gender="Female" if i % 2 else "Male"))
+        db.session.commit()
+        self.snapshot.refresh(force=True)
+        self.assertEqual(self.snapshot.count_movies({'title': None}), 5)
+        self.assertEqual(self.snapshot.count_movies({'released_after': date(2021, 1, 1)}), 4)
+        self.assertEqual(self.snapshot.count_actors({'gender': None, 'min_age': None}), 5)
+        self.assertEqual(self.snapshot.count_actors({'gender': 'Male', 'min_age': 0}), 3)
+        self.assertEqual(self.snapshot.count_actors({'gender': 'male', 'min_age': None}), 3)
+        self.assertEqual(self.snapshot.count_actors({'gender': 'robot', 'min_age': None}), 0)
+
+    def test_incremental_refresh(self):
+        self.snapshot.refresh(force=True)
+        movie_id = self.add_movie("New Movie", date(2023, 1, 1))
+        self.snapshot.refresh(force=True)
+        self.assertEqual(self.snapshot.query_movies({})[0]['title'], "New Movie")
+
+        movie = Movie.query.get(movie_id)
+        movie.title = "Updated Title"
+        record_change('movies', 'update', movie.id, movie.format())
+        db.session.commit()
+        self.snapshot.refresh(force=True)
+        self.assertEqual(self.snapshot.query_movies({})[0]['title'], "Updated Title")
+
+        record_change('movies', 'delete', movie_id)
+        Movie.query.filter_by(id=movie_id).delete()
+        db.session.commit()
+        self.snapshot.refresh(force=True)
+        self.assertEqual(self.snapshot.query_movies({}), [])
+
+    def test_reload_after_compaction(self):
+        self.add_movie("Old Movie", date(2023, 1, 1))
+        self.snapshot.refresh(force=True)
+        db.session.add(Movie(title="Missed Movie", release_date=date(2023, 1, 1)))
+        db.session.commit()
+        self.add_movie("New Movie", date(2023, 1, 1))
+        compact_changes(max_rows=0)
+        self.snapshot.refresh(force=True)
+        self.assertEqual(len(self.snapshot.query_movies({})), 3)
+
+if __name__ == '__main__':
+    unittest.main()
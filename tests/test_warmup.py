@@ -0,0 +1,79 @@
+import unittest
+import threading
+from unittest import mock
+from app import app, db, Movie
+import auth
+from warmup import Warmup
+
+"""Test cases for the start-up warm-up and the /ready endpoint."""
+
+class TestWarmup(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        app.config['TESTING'] = True
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        cls.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+
+    @classmethod
+    def tearDownClass(cls):
+        with app.app_context():
+            db.drop_all()
+
+    def setUp(self):
+        self.warmup = Warmup()
+        self.release = threading.Event()
+        self.patches = [
+            mock.patch('app.app_warmup', self.warmup),
+            mock.patch.object(auth, 'JWKS_URL', 'https://example.auth0.com/.well-known/jwks.json'),
+            mock.patch.object(auth, 'get_jwks', return_value={'keys': [{'kid': 'a'}, {'kid': 'b'}]})
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        self.release.set()
+        if self.warmup.thread is not None:
+            self.warmup.thread.join(5)
+        for patch in reversed(self.patches):
+            patch.stop()
+
+    def test_not_ready_until_warmup_finishes(self):
+        self.warmup.start([lambda: self.release.wait(5)])
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.json['ready'])
+
+        self.release.set()
+        self.warmup.thread.join(5)
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json['ready'])
+        self.assertEqual(
+            {name: step['status'] for name, step in response.json['warmup'].items()},
+            {'jwks': 'ok', 'pool': 'ok', 'statements': 'ok'}
+        )
+        self.assertEqual(response.json['warmup']['jwks']['detail'], '2 keys cached')
+
+    def test_failed_step_is_reported_but_still_ready(self):
+        def broken():
+            raise RuntimeError('boom')
+
+        self.warmup.start([lambda: Movie.query.get(0), broken])
+        self.warmup.thread.join(5)
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['warmup']['statements']['status'], 'failed')
+        self.assertNotIn('error', response.json['warmup']['statements'])
+        self.assertEqual(self.warmup.report(errors=True)['statements']['error'], 'boom')
+
+    def test_ready_without_warmup(self):
+        response = self.client.get('/ready')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['warmup'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
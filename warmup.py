@@ -0,0 +1,97 @@
+import os
+import threading
+import time
+from sqlalchemy import text
+from models import app, db
+import auth
+
+# Warm-up Config
+WARMUP_ON_START = os.getenv('WARMUP_ON_START', 'false').lower() in ('1', 'true', 'yes')
+# Connections to open up front (0: the pool's own size)
+WARMUP_POOL_CONNECTIONS = int(os.getenv('WARMUP_POOL_CONNECTIONS', '0'))
+
+## Warm-up steps
+def fetch_jwks():
+    if not auth.JWKS_URL:
+        return 'skipped, neither AUTH0_DOMAIN nor JWKS_URL is set'
+    return f"{len(auth.get_jwks()['keys'])} keys cached"
+
+def open_pool():
+    # Check the connections out together, otherwise the pool hands back the same one
+    pool = db.engine.pool
+    wanted = WARMUP_POOL_CONNECTIONS or (pool.size() if hasattr(pool, 'size') else 1)
+    connections = []
+    try:
+        for _ in range(wanted):
+            connection = db.engine.connect()
+            connections.append(connection)
+            connection.execute(text('SELECT 1'))
+    finally:
+        for connection in connections:
+            connection.close()
+    return f'{len(connections)} connections opened'
+
+def compile_statements(hot_queries):
+    # Running each query once fills the engine's compiled-statement cache
+    try:
+        for query in hot_queries:
+            query()
+    finally:
+        db.session.remove()
+    return f'{len(hot_queries)} statements compiled'
+
+## Warm-up
+'''
+Warmup
+Runs the slow first-time work (JWKS download, opening the pool's connections,
+compiling the hot statements) on a background thread when the worker starts,
+so it is not paid by live traffic. /ready reports not-ready until it is done.
+A failed step is reported (its error only on the authenticated /breakers) but
+does not keep the worker out of rotation: the
+same work is simply done lazily, as before.
+'''
+class Warmup:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.finished = threading.Event()
+        self.steps = {}
+
+    def start(self, hot_queries):
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self.run, args=(hot_queries,), name='warmup', daemon=True)
+            self.thread.start()
+
+    def step(self, name, fn, *args):
+        self.steps[name] = {'status': 'running'}
+        started = time.monotonic()
+        try:
+            detail = fn(*args)
+            self.steps[name] = {'status': 'ok', 'detail': detail}
+        except Exception as e:
+            self.steps[name] = {'status': 'failed', 'error': str(e)}
+        self.steps[name]['seconds'] = round(time.monotonic() - started, 3)
+
+    def run(self, hot_queries):
+        for name in ('jwks', 'pool', 'statements'):
+            self.steps[name] = {'status': 'pending'}
+        with app.app_context():
+            self.step('jwks', fetch_jwks)
+            self.step('pool', open_pool)
+            self.step('statements', compile_statements, hot_queries)
+        self.finished.set()
+
+    def ready(self):
+        # Workers started without warm-up are ready straight away
+        return self.thread is None or self.finished.is_set()
+
+    def report(self, errors=False):
+        # Failed steps keep their error message only when asked for (it can name hosts)
+        return {
+            name: {key: value for key, value in status.items() if errors or key != 'error'}
+            for name, status in self.steps.items()
+        }
+
+app_warmup = Warmup()